@@ -0,0 +1,61 @@
+# backend/bench_serialization.py
+# Per-row cost of encoding /movies results: validated Movie models re-checked against the response model,
+# as the endpoints used to do, against the trusted path that encodes projected dictionaries directly.
+# Usage: python bench_serialization.py [rows] [repeats]
+
+import random
+import sys
+import time
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import parse_obj_as
+
+import main
+from main import Movie, encode_json, movie_payload, shape_movies
+
+def sample_documents(rows: int):
+    rnd = random.Random(0)
+    documents = []
+    for movie_id in range(rows):
+        document = {name: None for name in main.MOVIE_FIELD_NAMES}
+        document.update(
+            id=movie_id, title=f"Movie {movie_id}", original_title=f"Movie {movie_id}", vote_average=rnd.uniform(0, 10),
+            vote_count=rnd.randint(0, 20000), status="Released", release_date="2001-01-01", release_year=2001,
+            revenue=rnd.randint(0, 10**9), runtime=rnd.randint(80, 180), adult=False, budget=rnd.randint(0, 10**8),
+            imdb_id=f"tt{movie_id:07d}", original_language="en", overview="An overview " * 20, popularity=rnd.uniform(0, 100),
+            tagline="A tagline", production_companies="Studio", production_countries=["United States of America"],
+            spoken_languages=["English"], keywords=["keyword"] * 5, Director="Director", AverageRating=rnd.uniform(0, 10),
+            genres_list=["Drama", "Comedy"], Cast_list=["Actor"] * 8, overview_sentiment=0.1, all_combined_keywords=["keyword"] * 10
+        )
+        documents.append(document)
+    return documents
+
+def validated_path(documents):
+    # Movie(**document) in the handler, then FastAPI validating and encoding the models for response_model
+    movies = shape_movies(documents, None)
+    return JSONResponse(content=jsonable_encoder(parse_obj_as(List[Movie], movies))).body
+
+def trusted_path(documents):
+    return encode_json(movie_payload(documents, None))
+
+def per_row_microseconds(path, documents, repeats: int):
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        path(documents)
+        best = min(best, time.perf_counter() - started)
+    return best / len(documents) * 1_000_000
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    documents = sample_documents(rows)
+
+    encoder = "orjson" if main.orjson is not None else "json"
+    before = per_row_microseconds(validated_path, documents, repeats)
+    after = per_row_microseconds(trusted_path, documents, repeats)
+    print(f"{rows} rows, best of {repeats}")
+    print(f"validated models + response_model: {before:8.2f} us/row")
+    print(f"trusted projection + {encoder:<13}: {after:8.2f} us/row  ({before / after:.1f}x)")
@@ -1,16 +1,212 @@
 # backend/main.py
 
-from fastapi import FastAPI, HTTPException, Query, Depends
+from fastapi import FastAPI, HTTPException, Query, Depends, Request
 from motor.motor_asyncio import AsyncIOMotorClient
-from pydantic import BaseModel, Field
-from typing import List, Optional
+import pymongo
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReturnDocument, UpdateOne, monitoring
+from pymongo.errors import PyMongoError
+from pymongo.read_concern import ReadConcern
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
+from pydantic import BaseModel, Field, conint, create_model
+from typing import List, NamedTuple, Optional, Union
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from passlib.context import CryptContext  # For hashing passwords
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
 from jose import JWTError, jwt
 from fastapi.security import OAuth2PasswordBearer
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from contextlib import asynccontextmanager
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.routing import Match
+import asyncio
+import logging
+import os
+import time
+import heapq
+import base64
+import contextvars
+import copy
+import functools
+import hashlib
+import inspect
+import json
+import math
+import re
+import secrets
+import threading
+import unicodedata
+from bisect import bisect_left
+from collections import Counter, OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("uvicorn.error")
+
+# Brotli compression is used when brotli-asgi is installed, gzip otherwise
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:
+    BrotliMiddleware = None
+
+# Movie payloads are encoded with orjson when it is installed, the json module otherwise
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    current_handler.set("lifespan")
+
+    # Open the connection pool before the first request instead of during it
+    try:
+        await warm_up_mongo()
+    except PyMongoError as e:
+        logger.error("Could not connect to MongoDB: %s", e)
+
+    # Make sure every query shape the API issues is backed by an index before serving traffic
+    try:
+        await ensure_indexes()
+        await check_query_plans()
+    except PyMongoError as e:
+        logger.error("Could not provision MongoDB indexes: %s", e)
+
+    # Materialize the analytics rollups in the background and keep them in sync with the catalogue
+    stats_task = asyncio.create_task(watch_movie_stats())
+    write_behind_task = asyncio.create_task(run_write_behind())
+    yield
+    stats_task.cancel()
+
+    # Stop the periodic flusher and write out whatever is still buffered
+    write_behind_task.cancel()
+    try:
+        await write_behind_task
+    except asyncio.CancelledError:
+        pass
+    await flush_pending_writes()
+    client.close()
+
+app = FastAPI(lifespan=lifespan)
+
+# Conditional GET and compression
+# Routes answered from the in-memory snapshot only change when it is rebuilt, so their ETag is derived from the
+# dataset version, build time and normalized request, and a matching If-None-Match gets a 304 before the
+# handler runs. Routes reading MongoDB directly are tagged with a hash of the body they return instead, so an
+# edited movie never matches an old ETag. Bodies above COMPRESSION_MINIMUM_SIZE bytes are compressed
+HTTP_CACHE_MAX_AGE_SECONDS = int(os.getenv("HTTP_CACHE_MAX_AGE_SECONDS", "60"))
+COMPRESSION_MINIMUM_SIZE = int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1024"))
+CONDITIONAL_PREFIX = "/movies"
+SNAPSHOT_ROUTES = {
+    "/movies/pop-vs-rating", "/movies/production", "/movies/top-actors", "/movies/unique-languages",
+    "/movies/production-country", "/movies/genre-breakdown", "/movies/releases-over-time", "/movies/kpis",
+    "/movies/suggest", "/movies/actors/frequency", "/movies/ratings/distribution"
+}
+
+def negotiated_encoding(request: Request):
+    # Each content coding gets its own strong ETag
+    accepted = {coding.split(";")[0].strip() for coding in request.headers.get("accept-encoding", "").split(",")}
+    if BrotliMiddleware is not None and "br" in accepted:
+        return "br"
+    return "gzip" if "gzip" in accepted else "identity"
+
+def movie_etag(request: Request, *validators):
+    normalized = json.dumps([
+        *validators,
+        request.url.path,
+        sorted(request.query_params.multi_items()),
+        request.headers.get("accept", ""),
+        negotiated_encoding(request)
+    ])
+    return '"' + hashlib.sha256(normalized.encode()).hexdigest()[:32] + '"'
+
+def etag_matches(header: str, etag: str):
+    # Weak comparison, as If-None-Match requires
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    return "*" in candidates or etag in (candidate[2:] if candidate.startswith("W/") else candidate for candidate in candidates)
+
+def not_modified_since(header: str, last_modified: datetime):
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    return since.tzinfo is not None and last_modified.replace(microsecond=0) <= since
+
+def conditional_get(inner):
+    # A plain ASGI middleware, so handlers still receive the client's http.disconnect and can be cancelled
+    async def middleware(scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD") or not scope["path"].startswith(CONDITIONAL_PREFIX):
+            return await inner(scope, receive, send)
+
+        request = Request(scope)
+        version = stats_snapshot["version"]
+        if version is None or resolve_route(scope)[0] not in SNAPSHOT_ROUTES:
+            return await tag_response_body(request, inner, receive, send)
+
+        last_modified = stats_snapshot["built_at"].replace(tzinfo=timezone.utc)
+        headers = {
+            "ETag": movie_etag(request, version, last_modified.isoformat()),
+            "Last-Modified": format_datetime(last_modified, usegmt=True),
+            "Cache-Control": f"public, max-age={HTTP_CACHE_MAX_AGE_SECONDS}",
+            "Vary": "Accept, Accept-Encoding"
+        }
+
+        # If-Modified-Since is only considered when no If-None-Match is sent
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            not_modified = etag_matches(if_none_match, headers["ETag"])
+        else:
+            not_modified = not_modified_since(request.headers.get("if-modified-since", ""), last_modified)
+        if not_modified:
+            return await Response(status_code=304, headers=headers)(scope, receive, send)
+
+        async def send_tagged(message):
+            # The dataset can change while the handler runs, such responses are not tagged
+            if message["type"] == "http.response.start" and message["status"] == 200 and stats_snapshot["version"] == version:
+                MutableHeaders(scope=message).update(headers)
+            await send(message)
+
+        await inner(scope, receive, send_tagged)
+    return middleware
+
+async def tag_response_body(request: Request, inner, receive, send):
+    # Streamed exports are never buffered, everything else is small enough to hash
+    start = None
+    chunks = []
+
+    async def send_buffered(message):
+        nonlocal start
+        if message["type"] == "http.response.start":
+            content_type = Headers(raw=message["headers"]).get("content-type", "")
+            if message["status"] == 200 and not content_type.startswith(NDJSON_MEDIA_TYPE):
+                start = message
+                return
+        if start is None or message["type"] != "http.response.body":
+            return await send(message)
+
+        chunks.append(message.get("body", b""))
+        if message.get("more_body", False):
+            return
+        body = b"".join(chunks)
+        headers = {
+            "ETag": movie_etag(request, hashlib.sha256(body).hexdigest()),
+            "Cache-Control": f"public, max-age={HTTP_CACHE_MAX_AGE_SECONDS}",
+            "Vary": "Accept, Accept-Encoding"
+        }
+        if etag_matches(request.headers.get("if-none-match", ""), headers["ETag"]):
+            return await Response(status_code=304, headers=headers)(request.scope, receive, send)
+        MutableHeaders(scope=start).update(headers)
+        await send(start)
+        await send({"type": "http.response.body", "body": body})
 
-app = FastAPI()
+    await inner(request.scope, receive, send_buffered)
+
+app.add_middleware(conditional_get)
+
+if BrotliMiddleware is not None:
+    app.add_middleware(BrotliMiddleware, minimum_size=COMPRESSION_MINIMUM_SIZE, gzip_fallback=True)
+else:
+    app.add_middleware(GZipMiddleware, minimum_size=COMPRESSION_MINIMUM_SIZE)
 
 # CORS configuration to allow frontend to access backend
 app.add_middleware(
@@ -21,17 +217,676 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Prometheus metrics
+# Request latency is recorded per route template by an ASGI middleware that also publishes the handler name in
+# a context variable. Motor runs commands on worker threads with a copy of that context, so the command and
+# pool listeners below label every MongoDB command with the handler that issued it. Served at GET /metrics
+METRIC_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRIC_DEFINITIONS = {
+    "http_request_duration_seconds": ("histogram", "HTTP request latency until the last body chunk was sent", ("method", "route")),
+    "http_requests_total": ("counter", "HTTP requests by response status", ("method", "route", "status")),
+    "http_requests_in_flight": ("gauge", "HTTP requests currently being served", ("method", "route")),
+    "mongodb_command_duration_seconds": ("histogram", "MongoDB command round trip time", ("command", "collection", "handler")),
+    "mongodb_command_failures_total": ("counter", "MongoDB commands that returned an error", ("command", "collection", "handler")),
+    "mongodb_pool_checkout_wait_seconds": ("histogram", "Time spent waiting for a pooled MongoDB connection", ("outcome",)),
+    "mongodb_pool_connections": ("gauge", "MongoDB connections by state", ("state",))
+}
+
+current_handler = contextvars.ContextVar("current_handler", default="background")
+metric_series = defaultdict(dict)  # metric name -> label values -> value, or bucket counts for histograms
+metric_lock = threading.Lock()  # pymongo events arrive on Motor's worker threads
+
+def observe(name: str, labels: tuple, seconds: float):
+    with metric_lock:
+        series = metric_series[name].get(labels)
+        if series is None:
+            series = metric_series[name][labels] = {"buckets": [0] * len(METRIC_BUCKETS), "sum": 0.0, "count": 0}
+        bucket = bisect_left(METRIC_BUCKETS, seconds)
+        if bucket < len(METRIC_BUCKETS):
+            series["buckets"][bucket] += 1
+        series["sum"] += seconds
+        series["count"] += 1
+
+def increment(name: str, labels: tuple, amount: float = 1):
+    with metric_lock:
+        metric_series[name][labels] = metric_series[name].get(labels, 0) + amount
+
+def resolve_route(scope):
+    # Route templates keep the label set bounded, paths such as /movies/123 would not
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path, route.name
+    return "unmatched", "unmatched"
+
+def request_metrics(inner):
+    async def middleware(scope, receive, send):
+        if scope["type"] != "http":
+            return await inner(scope, receive, send)
+
+        route, handler = resolve_route(scope)
+        labels = (scope["method"], route)
+        status = 500  # Reported when the application fails before starting a response
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        increment("http_requests_in_flight", labels)
+        token = current_handler.set(handler)
+        started = time.perf_counter()
+        try:
+            await inner(scope, receive, send_with_status)
+        finally:
+            current_handler.reset(token)
+            increment("http_requests_in_flight", labels, -1)
+            observe("http_request_duration_seconds", labels, time.perf_counter() - started)
+            increment("http_requests_total", labels + (str(status),))
+    return middleware
+
+# Added last so it is the outermost middleware and times compression and CORS as well
+app.add_middleware(request_metrics)
+
+class CommandMetrics(monitoring.CommandListener):
+    def __init__(self):
+        self.running = {}  # (connection, request id) -> labels of commands awaiting their reply
+
+    def started(self, event):
+        # The collection is the value of the command name key, getMore names it separately
+        target = event.command.get("collection") if event.command_name == "getMore" else event.command.get(event.command_name)
+        collection = target if isinstance(target, str) else ""
+        labels = (event.command_name, collection, current_handler.get())
+        self.running[(event.connection_id, event.request_id)] = (labels, breaker_usage.get())
+
+    def succeeded(self, event):
+        self.finish(event, failed=False)
+
+    def failed(self, event):
+        self.finish(event, failed=True)
+
+    def finish(self, event, failed: bool):
+        running = self.running.pop((event.connection_id, event.request_id), None)
+        if running is None:
+            return
+        labels, usage = running
+        observe("mongodb_command_duration_seconds", labels, event.duration_micros / 1_000_000)
+        if failed:
+            increment("mongodb_command_failures_total", labels)
+        if usage is not None:
+            with metric_lock:
+                usage["commands"] += 1
+                usage["seconds"] += event.duration_micros / 1_000_000
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    def connection_created(self, event):
+        increment("mongodb_pool_connections", ("open",))
+
+    def connection_closed(self, event):
+        increment("mongodb_pool_connections", ("open",), -1)
+
+    def connection_checked_out(self, event):
+        increment("mongodb_pool_connections", ("checked_out",))
+        observe("mongodb_pool_checkout_wait_seconds", ("ok",), event.duration or 0.0)
+
+    def connection_check_out_failed(self, event):
+        observe("mongodb_pool_checkout_wait_seconds", (event.reason,), event.duration or 0.0)
+
+    def connection_checked_in(self, event):
+        increment("mongodb_pool_connections", ("checked_out",), -1)
+
+    # The remaining pool events carry nothing worth a metric
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
 # MongoDB connection
-client = AsyncIOMotorClient("mongodb://localhost:27017")
-db = client["IWD"]
+# The client connects lazily, the lifespan opens MONGO_WARMUP_CONNECTIONS connections before serving and closes
+# the pool on shutdown. Compressors are a comma separated list, e.g. "zstd,snappy,zlib"
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
+MONGO_DATABASE = os.getenv("MONGO_DATABASE", "IWD")
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "10"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "30000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000"))
+MONGO_COMPRESSORS = [name.strip() for name in os.getenv("MONGO_COMPRESSORS", "").split(",") if name.strip()]
+MONGO_WARMUP_CONNECTIONS = max(int(os.getenv("MONGO_WARMUP_CONNECTIONS", str(MONGO_MIN_POOL_SIZE))), 1)
+
+client = AsyncIOMotorClient(
+    MONGO_URI,
+    appname="imdb-backend",
+    maxPoolSize=MONGO_MAX_POOL_SIZE,
+    minPoolSize=MONGO_MIN_POOL_SIZE,
+    maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+    connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+    serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+    waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    compressors=MONGO_COMPRESSORS,
+    event_listeners=[CommandMetrics(), PoolMetrics()]
+)
+db = client[MONGO_DATABASE]
 movies_collection = db["IMDb"]
 user = db["user"]
+refresh_tokens = db["refresh_tokens"]
+
+# Analytics read routing
+# The rollup, chart and index builds scan or $unwind the whole catalogue, so they read through their own
+# read preference and stay off the primary that serves logins and user writes. Tags pick dedicated nodes,
+# e.g. MONGO_ANALYTICS_READ_TAGS="nodeType:ANALYTICS", falling back to any secondary when none match.
+# Builds run in a causally consistent session started by reading the dataset version on the primary, so a
+# lagging secondary waits until it has the data of that version instead of returning a partial catalogue
+READ_PREFERENCES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest
+}
+MONGO_ANALYTICS_READ_PREFERENCE = os.getenv("MONGO_ANALYTICS_READ_PREFERENCE", "secondaryPreferred")
+MONGO_ANALYTICS_READ_TAGS = os.getenv("MONGO_ANALYTICS_READ_TAGS", "")
+MONGO_ANALYTICS_MAX_STALENESS_SECONDS = int(os.getenv("MONGO_ANALYTICS_MAX_STALENESS_SECONDS", "90"))  # 90 is the smallest MongoDB accepts, -1 means no limit
+
+def analytics_read_preference():
+    if MONGO_ANALYTICS_READ_PREFERENCE not in READ_PREFERENCES:
+        raise ValueError(f"Unknown MONGO_ANALYTICS_READ_PREFERENCE: {MONGO_ANALYTICS_READ_PREFERENCE}")
+    mode = READ_PREFERENCES[MONGO_ANALYTICS_READ_PREFERENCE]
+    if mode is Primary:
+        return Primary()
+
+    tag_sets = None
+    if MONGO_ANALYTICS_READ_TAGS:
+        tags = dict(pair.split(":", 1) for pair in MONGO_ANALYTICS_READ_TAGS.split(","))
+        tag_sets = [tags, {}]
+    return mode(tag_sets=tag_sets, max_staleness=MONGO_ANALYTICS_MAX_STALENESS_SECONDS)
+
+analytics_movies = movies_collection.with_options(read_preference=analytics_read_preference(), read_concern=ReadConcern("majority"))
+
+async def warm_up_mongo():
+    # Concurrent pings each check out a connection, so the pool is open before the first request
+    started = time.perf_counter()
+    await asyncio.gather(*(client.admin.command("ping") for _ in range(MONGO_WARMUP_CONNECTIONS)))
+    logger.info("Opened %d MongoDB connections in %.0f ms", MONGO_WARMUP_CONNECTIONS, (time.perf_counter() - started) * 1000)
+
+# Index provisioning
+# Declared indexes for every query shape the API issues, reconciled against MongoDB at startup
+REQUIRED_INDEXES = {
+    "IMDb": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("genres_list", ASCENDING), ("AverageRating", DESCENDING)], name="genres_rating"),
+        IndexModel([("genres_list", ASCENDING), ("release_year", ASCENDING)], name="genres_year"),
+        IndexModel([("AverageRating", DESCENDING), ("id", DESCENDING)], name="rating_id"),
+        IndexModel([("popularity", DESCENDING), ("id", DESCENDING)], name="popularity_id"),
+        IndexModel([("vote_average", DESCENDING), ("id", DESCENDING)], name="vote_average_id"),
+        IndexModel([("release_year", ASCENDING)], name="release_year"),
+        IndexModel([("updated_at", DESCENDING)], name="updated_at")
+    ],
+    "user": [
+        IndexModel([("Email", ASCENDING)], name="email_unique", unique=True)
+    ],
+    "refresh_tokens": [
+        IndexModel([("token_hash", ASCENDING)], name="token_hash_unique", unique=True),
+        IndexModel([("family", ASCENDING)], name="family"),
+        IndexModel([("email", ASCENDING)], name="email"),
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0)
+    ]
+}
+
+# Representative queries checked for collection scans at startup: (handler, collection, filter, sort)
+QUERY_SHAPES = [
+    ("get_movie", "IMDb", {"id": 1}, None),
+    ("get_dataset_version", "IMDb", {}, [("updated_at", -1)]),
+    ("get_movies", "IMDb", {}, [("vote_average", -1), ("id", -1)]),
+    ("get_movies", "IMDb", {"release_year": 2000}, [("vote_average", -1), ("id", -1)]),
+    ("get_top_rated_movies", "IMDb", {"genres_list": "Drama"}, [("AverageRating", -1)]),
+    ("get_top_rated_movies", "IMDb", {"AverageRating": {"$ne": None}}, [("AverageRating", -1)]),
+    ("get_popular_movies", "IMDb", {"AverageRating": {"$ne": None}}, [("popularity", -1)]),
+    ("search_movies", "IMDb", {"genres_list": {"$in": ["Drama"]}, "release_year": {"$gte": 2000, "$lte": 2010}}, None),
+    ("search_movies", "IMDb", {"release_year": {"$gte": 2000, "$lte": 2010}}, [("id", -1)]),
+    ("login", "user", {"Email": "user@example.com"}, None),
+    ("refresh_access_token", "refresh_tokens", {"token_hash": "0" * 64}, None)
+]
+
+def index_options(info: dict):
+    # Options that change what an index does, a difference means it has to be rebuilt
+    return info.get("unique", False), info.get("expireAfterSeconds")
+
+async def ensure_indexes():
+    for collection_name, indexes in REQUIRED_INDEXES.items():
+        collection = db[collection_name]
+        existing = await collection.index_information()
+        existing_keys = {tuple(info["key"]): name for name, info in existing.items()}
+
+        for index in indexes:
+            spec = index.document
+            name = spec["name"]
+            key = tuple((field, direction) for field, direction in spec["key"].items())
+            current = existing.get(name)
+
+            if current is not None:
+                if tuple(current["key"]) == key and index_options(current) == index_options(spec):
+                    continue
+                # Same name but a different definition, rebuild it
+                logger.warning("Rebuilding index %s.%s to match its declaration", collection_name, name)
+                await collection.drop_index(name)
+            elif key in existing_keys:
+                other = existing_keys[key]
+                if index_options(existing[other]) != index_options(spec):
+                    logger.error("Index %s.%s exists with other options, migrate it to match %s", collection_name, other, name)
+                else:
+                    logger.info("Index %s.%s already exists as %s", collection_name, name, other)
+                continue
+
+            try:
+                await collection.create_indexes([index])
+                logger.info("Created index %s.%s", collection_name, name)
+            except PyMongoError as e:
+                # A unique index fails to build over duplicate values, keep serving and report it
+                logger.error("Could not create index %s.%s: %s", collection_name, name, e)
+
+        # Undeclared indexes are reported but never dropped automatically
+        declared_keys = {tuple(index.document["key"].items()) for index in indexes}
+        for name, info in existing.items():
+            if name != "_id_" and tuple(info["key"]) not in declared_keys:
+                logger.info("Index %s.%s is not declared in REQUIRED_INDEXES", collection_name, name)
+
+def plan_stages(plan: dict):
+    # Every stage name of a query plan tree
+    yield plan.get("stage")
+    for child in [plan.get("inputStage"), *plan.get("inputStages", [])]:
+        if child:
+            yield from plan_stages(child)
+
+async def check_query_plans():
+    for handler, collection_name, query, sort in QUERY_SHAPES:
+        command = {"find": collection_name, "filter": query}
+        if sort:
+            command["sort"] = dict(sort)
+        explain = await db.command("explain", command, verbosity="queryPlanner")
+        winning_plan = explain.get("queryPlanner", {}).get("winningPlan", {})
+        if "COLLSCAN" in plan_stages(winning_plan.get("queryPlan", winning_plan)):
+            logger.warning("Query shape of %s on %s still uses a COLLSCAN: filter=%s sort=%s", handler, collection_name, query, sort)
+
+# Single-flight calls
+# Identical calls made while one is already running await that call instead of starting their own, so a burst
+# of dashboards costs MongoDB one aggregation per distinct pipeline. Counters are kept per call name
+inflight_calls = {}  # key -> {"task": shared task, "waiters": callers awaiting it}
+SINGLE_FLIGHT_BUDGET_SECONDS = float(os.getenv("SINGLE_FLIGHT_BUDGET_SECONDS", "120"))
+single_flight_metrics = defaultdict(lambda: {"calls": 0, "executed": 0, "coalesced": 0, "failed": 0})
+
+async def run_with_budget(factory, seconds: float):
+    with pymongo.timeout(seconds):
+        return await factory()
+
+async def single_flight(name: str, key, factory, copy_result: bool = True):
+    metrics = single_flight_metrics[name]
+    metrics["calls"] += 1
+    key = (name, key)
+
+    flight = inflight_calls.get(key)
+    if flight is None:
+        # The shared call starts from a fresh context, so the time budget, request tag and cancellation of
+        # whichever caller came first do not apply to it. Only the handler label is carried over
+        context = contextvars.Context()
+        context.run(current_handler.set, current_handler.get())
+        task = context.run(asyncio.ensure_future, run_with_budget(factory, SINGLE_FLIGHT_BUDGET_SECONDS))
+        flight = inflight_calls[key] = {"task": task, "waiters": 0}
+        task.add_done_callback(lambda _: inflight_calls.pop(key, None))
+        metrics["executed"] += 1
+    else:
+        metrics["coalesced"] += 1
+    flight["waiters"] += 1
+
+    # A caller that goes away must not cancel the call the others are waiting on
+    try:
+        result = await asyncio.shield(flight["task"])
+    except Exception:
+        metrics["failed"] += 1
+        raise
+
+    # Callers that shared a result get their own copy, so none of them can change what the others see
+    if copy_result and flight["waiters"] > 1:
+        return copy.deepcopy(result)
+    return result
+
+async def run_aggregate(name: str, collection, pipeline: list, length: Optional[int] = None, session=None):
+    # Aggregations are coalesced on their collection and normalized pipeline
+    key = (collection.name, json.dumps(pipeline, sort_keys=True, default=str), length)
+    return await single_flight(name, key, lambda: collection.aggregate(pipeline, session=session).to_list(length=length))
+
+# Read response cache
+# GET /movies/* responses are kept for RESPONSE_CACHE_SOFT_TTL_SECONDS and then revalidated in the background
+# while the stored copy is still served, up to RESPONSE_CACHE_HARD_TTL_SECONDS. Calls that fail or take longer
+# than MONGO_SLOW_CALL_SECONDS count against a circuit breaker, and while it is open the handlers are not called
+# at all: stale copies are served with a Warning header and requests without one get a 503. Only the MongoDB
+# commands a call issues itself are timed, so admission queueing and waiting on a shared snapshot build are
+# not, and calls that never reached MongoDB leave the breaker as it was. Typeahead is left out, it is an
+# in-memory lookup and its long tail of prefixes would evict the entries worth keeping
+RESPONSE_CACHE_SOFT_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_SOFT_TTL_SECONDS", "30"))
+RESPONSE_CACHE_HARD_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_HARD_TTL_SECONDS", "600"))
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "512"))
+MONGO_SLOW_CALL_SECONDS = float(os.getenv("MONGO_SLOW_CALL_SECONDS", "2"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))  # Consecutive failed or slow calls
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "15"))  # Time open before a trial call
+STALE_WARNING = '110 - "Response is Stale"'
+
+response_cache = OrderedDict()  # (handler, arguments) -> {"value": handler result, "stored_at": monotonic time}
+revalidating = {}  # key -> background revalidation task
+mongo_breaker = {"state": "closed", "failures": 0, "opened_at": 0.0, "trial": False}
+response_cache_metrics = {"hits": 0, "misses": 0, "stale": 0, "revalidations": 0, "failed_revalidations": 0,
+                          "unavailable": 0, "evictions": 0}
+breaker_metrics = {"trips": 0, "failures": 0, "slow_calls": 0, "short_circuited": 0}
+breaker_usage = contextvars.ContextVar("breaker_usage", default=None)  # MongoDB commands of the current call
+
+def is_mongo_failure(error: Exception):
+    # Handlers that wrap driver errors report them as a 5xx
+    if isinstance(error, HTTPException):
+        return error.status_code >= 500
+    return isinstance(error, (PyMongoError, asyncio.TimeoutError))
+
+def breaker_allows_call():
+    if mongo_breaker["state"] == "closed":
+        return True
+    # Half-open: once the reset delay has passed a single trial call decides whether to close again
+    if time.monotonic() - mongo_breaker["opened_at"] >= BREAKER_RESET_SECONDS and not mongo_breaker["trial"]:
+        mongo_breaker.update(state="half-open", trial=True)
+        return True
+    breaker_metrics["short_circuited"] += 1
+    return False
+
+def record_breaker_success(usage: dict):
+    if usage["commands"] == 0:
+        # Nothing reached MongoDB, a half-open breaker lets the next call make the trial
+        if mongo_breaker["state"] == "half-open":
+            mongo_breaker["trial"] = False
+        return
+    if usage["seconds"] > MONGO_SLOW_CALL_SECONDS:
+        breaker_metrics["slow_calls"] += 1
+        record_breaker_failure()
+        return
+    mongo_breaker.update(state="closed", failures=0, trial=False)
+
+def record_breaker_failure():
+    breaker_metrics["failures"] += 1
+    mongo_breaker["failures"] += 1
+    if mongo_breaker["state"] == "half-open" or mongo_breaker["failures"] >= BREAKER_FAILURE_THRESHOLD:
+        if mongo_breaker["state"] != "open":
+            breaker_metrics["trips"] += 1
+            logger.warning("MongoDB circuit breaker open after %s failed or slow calls", mongo_breaker["failures"])
+        mongo_breaker.update(state="open", opened_at=time.monotonic(), trial=False)
+
+async def call_through_breaker(handler, kwargs: dict):
+    # Shared single-flight calls start from a fresh context, so their commands are not counted here
+    usage = {"commands": 0, "seconds": 0.0}
+    token = breaker_usage.set(usage)
+    try:
+        result = await handler(**kwargs)
+    except Exception as e:
+        if is_mongo_failure(e):
+            record_breaker_failure()
+        else:
+            # A 404 after a query is a MongoDB success, a 400 or 429 before any query is no outcome at all
+            record_breaker_success(usage)
+        raise
+    finally:
+        breaker_usage.reset(token)
+    record_breaker_success(usage)
+    return result
+
+def store_response(key, value):
+    # Streamed responses are consumed once and cannot be replayed
+    if isinstance(value, StreamingResponse):
+        return
+    response_cache[key] = {"value": value, "stored_at": time.monotonic()}
+    response_cache.move_to_end(key)
+    while len(response_cache) > RESPONSE_CACHE_SIZE:
+        response_cache.popitem(last=False)
+        response_cache_metrics["evictions"] += 1
+
+async def revalidate_response(key, handler, kwargs: dict):
+    # Runs on behalf of no client, so admission control must not tie it to the finished request
+    detached_call.set(True)
+    version = stats_snapshot["version"]
+    try:
+        value = await call_through_breaker(handler, kwargs)
+        if stats_snapshot["version"] == version:
+            store_response(key, value)
+    except Exception as e:
+        response_cache_metrics["failed_revalidations"] += 1
+        logger.warning("Could not revalidate %s: %s", key[0], e)
+    finally:
+        revalidating.pop(key, None)
+
+def schedule_revalidation(key, handler, kwargs: dict):
+    if key in revalidating or not breaker_allows_call():
+        return
+    response_cache_metrics["revalidations"] += 1
+    revalidating[key] = asyncio.create_task(revalidate_response(key, handler, kwargs))
+
+def cached_value(value, response: Response, state: str):
+    headers = {"X-Cache": state}
+    if state == "stale":
+        headers["Warning"] = STALE_WARNING
+    # Returned responses skip the injected one, so they are copied with the headers added. Direct calls, such
+    # as the /dashboard widgets, get the value as is
+    if response is None:
+        return value
+    if isinstance(value, Response) and not isinstance(value, StreamingResponse):
+        copied = Response(content=value.body, status_code=value.status_code, media_type=value.media_type,
+                          headers={name: header for name, header in value.headers.items() if name != "content-length"})
+        copied.headers.update(headers)
+        return copied
+    response.headers.update(headers)
+    return value
+
+def cached_response(handler):
+    # The wrapper takes the handler's parameters plus the outgoing Response, used to set the cache headers
+    signature = inspect.signature(handler)
+    response_parameter = inspect.Parameter("cache_response", inspect.Parameter.KEYWORD_ONLY, default=None, annotation=Response)
+
+    @functools.wraps(handler)
+    async def wrapper(**kwargs):
+        response = kwargs.pop("cache_response", None)
+        key = (handler.__name__, json.dumps(
+            {name: value for name, value in kwargs.items() if not isinstance(value, Request)}, sort_keys=True, default=str
+        ), wants_ndjson(kwargs["request"]) if "request" in kwargs else False)
+
+        entry = response_cache.get(key)
+        age = time.monotonic() - entry["stored_at"] if entry is not None else None
+        if entry is not None and age < RESPONSE_CACHE_SOFT_TTL_SECONDS:
+            response_cache_metrics["hits"] += 1
+            response_cache.move_to_end(key)
+            return cached_value(entry["value"], response, "hit")
+
+        if entry is not None and age < RESPONSE_CACHE_HARD_TTL_SECONDS:
+            response_cache_metrics["stale"] += 1
+            schedule_revalidation(key, handler, kwargs)
+            return cached_value(entry["value"], response, "stale")
+
+        if not breaker_allows_call():
+            response_cache_metrics["unavailable"] += 1
+            raise HTTPException(status_code=503, detail="Database temporarily unavailable",
+                                headers={"Retry-After": str(math.ceil(BREAKER_RESET_SECONDS))})
+
+        response_cache_metrics["misses"] += 1
+        version = stats_snapshot["version"]
+        value = await call_through_breaker(handler, kwargs)
+        # A value computed while the snapshot was replaced may come from the previous dataset version
+        if stats_snapshot["version"] == version:
+            store_response(key, value)
+        return cached_value(value, response, "miss")
+
+    wrapper.__signature__ = signature.replace(parameters=[*signature.parameters.values(), response_parameter])
+    return wrapper
+
+# Admission control
+# Every endpoint class gets its own slots per endpoint, so a burst of expensive requests queues behind itself
+# instead of starving cheap ones. Requests beyond the queue, or waiting longer than the queue timeout, get a
+# 429 with Retry-After. Admitted requests run under a time budget that pymongo sends as maxTimeMS with every
+# find, aggregate and getMore. The queries a request owns carry its request_comment, so when the client
+# disconnects the handler is cancelled and those operations are killed on the server. Coalesced aggregations
+# are shared with other callers and are left running. NDJSON streams are read after the handler returns and
+# are not budgeted
+ADMISSION_CLASSES = {
+    "analytics": {
+        "concurrency": int(os.getenv("ADMISSION_ANALYTICS_CONCURRENCY", "8")),
+        "queue": int(os.getenv("ADMISSION_ANALYTICS_QUEUE", "32")),
+        "budget_seconds": float(os.getenv("ADMISSION_ANALYTICS_BUDGET_SECONDS", "15"))
+    },
+    "search": {
+        "concurrency": int(os.getenv("ADMISSION_SEARCH_CONCURRENCY", "16")),
+        "queue": int(os.getenv("ADMISSION_SEARCH_QUEUE", "64")),
+        "budget_seconds": float(os.getenv("ADMISSION_SEARCH_BUDGET_SECONDS", "5"))
+    },
+    "catalogue": {
+        "concurrency": int(os.getenv("ADMISSION_CATALOGUE_CONCURRENCY", "32")),
+        "queue": int(os.getenv("ADMISSION_CATALOGUE_QUEUE", "128")),
+        "budget_seconds": float(os.getenv("ADMISSION_CATALOGUE_BUDGET_SECONDS", "5"))
+    }
+}
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "2"))
+ADMISSION_RETRY_AFTER_SECONDS = 1
+DISCONNECT_POLL_SECONDS = 0.25
+CLIENT_CLOSED_REQUEST = 499  # Never seen by the client, only by logs and metrics
+
+detached_call = contextvars.ContextVar("detached_call", default=False)
+request_comment = contextvars.ContextVar("request_comment", default=None)  # Tag of the queries a request owns
+KILL_OPERATIONS_TIMEOUT_SECONDS = 2
+admission_metrics = {}  # endpoint -> counters, see admission_control
+kill_tasks = set()  # Running kill_operations calls, referenced until they finish
+
+async def wait_for_disconnect(request: Request):
+    while not await request.is_disconnected():
+        await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+
+async def kill_operations(comment: str, metrics: dict):
+    # Only this application's own operations are visible and killable, which needs no extra privilege
+    try:
+        with pymongo.timeout(KILL_OPERATIONS_TIMEOUT_SECONDS):
+            operations = await client.admin.aggregate([
+                {"$currentOp": {}},
+                {"$match": {"$or": [{"command.comment": comment}, {"cursor.originatingCommand.comment": comment}]}}
+            ]).to_list(length=None)
+            for operation in operations:
+                await client.admin.command("killOp", op=operation["opid"])
+                metrics["killed_operations"] += 1
+    except PyMongoError as e:
+        logger.warning("Could not kill the operations of %s: %s", comment, e)
+
+async def run_until_disconnect(request: Optional[Request], call, metrics: dict):
+    # The handler runs as its own task so a disconnect can cancel it, which also closes its open cursors
+    task = asyncio.ensure_future(call)
+    if request is None or detached_call.get():
+        return await task
+
+    watcher = asyncio.ensure_future(wait_for_disconnect(request))
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+        if not task.done():
+            task.cancel()
+            await asyncio.wait({task})  # Let the handler unwind and close its cursors
+
+    if task.cancelled():
+        metrics["cancelled"] += 1
+        # Killed in the background from a fresh context, the request's own budget may already be spent and its
+        # admission slot is released right away
+        kill = contextvars.Context().run(asyncio.ensure_future, kill_operations(request_comment.get(), metrics))
+        kill_tasks.add(kill)
+        kill.add_done_callback(kill_tasks.discard)
+        raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Client closed request")
+    return task.result()
+
+def admission_control(endpoint_class: str):
+    limits = ADMISSION_CLASSES[endpoint_class]
+
+    def decorator(handler):
+        slots = asyncio.Semaphore(limits["concurrency"])
+        metrics = admission_metrics[handler.__name__] = {
+            "class": endpoint_class, "admitted": 0, "rejected": 0, "waiting": 0, "in_flight": 0,
+            "timed_out": 0, "cancelled": 0, "killed_operations": 0, "max_wait_ms": 0.0
+        }
+        # FastAPI passes the Request to a single parameter, so a handler taking one already shares it
+        signature = inspect.signature(handler)
+        parameters = list(signature.parameters.values())
+        request_name = next((parameter.name for parameter in parameters if parameter.annotation is Request), None)
+        if request_name is None:
+            request_name = "admission_request"
+            parameters.append(inspect.Parameter(request_name, inspect.Parameter.KEYWORD_ONLY, default=None, annotation=Request))
+
+        def reject(detail: str):
+            metrics["rejected"] += 1
+            return HTTPException(status_code=429, detail=detail, headers={"Retry-After": str(ADMISSION_RETRY_AFTER_SECONDS)})
+
+        @functools.wraps(handler)
+        async def wrapper(**kwargs):
+            request = kwargs.get(request_name) if request_name in signature.parameters else kwargs.pop(request_name, None)
+            if slots.locked():
+                if metrics["waiting"] >= limits["queue"]:
+                    raise reject("Too many requests, please try again shortly")
+
+                metrics["waiting"] += 1
+                started = time.perf_counter()
+                try:
+                    await asyncio.wait_for(slots.acquire(), ADMISSION_QUEUE_TIMEOUT_SECONDS)
+                except asyncio.TimeoutError:
+                    raise reject("Server busy, please try again shortly")
+                finally:
+                    metrics["waiting"] -= 1
+                    metrics["max_wait_ms"] = max(metrics["max_wait_ms"], round((time.perf_counter() - started) * 1000, 2))
+            else:
+                await slots.acquire()  # Returns at once while a slot is free
+
+            metrics["admitted"] += 1
+            metrics["in_flight"] += 1
+            token = request_comment.set(f"{handler.__name__}:{secrets.token_hex(8)}")
+            try:
+                with pymongo.timeout(limits["budget_seconds"]):
+                    return await run_until_disconnect(request, handler(**kwargs), metrics)
+            except PyMongoError as e:
+                if not e.timeout:
+                    raise
+                metrics["timed_out"] += 1
+                raise HTTPException(status_code=503, detail="The query exceeded its time budget",
+                                    headers={"Retry-After": str(ADMISSION_RETRY_AFTER_SECONDS)})
+            finally:
+                request_comment.reset(token)
+                metrics["in_flight"] -= 1
+                slots.release()
+
+        wrapper.__signature__ = signature.replace(parameters=parameters)
+        return wrapper
+    return decorator
 
 # Secret key and algorithm for JWT
 SECRET_KEY = "IWD"  # Make sure to use a strong key!
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30  # Token expiration time
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "14"))
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)  # For endpoints that also serve anonymous users
+
+# Comma separated list of emails allowed to call the /admin endpoints
+ADMIN_EMAILS = [email for email in os.getenv("ADMIN_EMAILS", "").split(",") if email]
 
 # Password hashing context
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -67,7 +922,7 @@ class FilterPreferences(BaseModel):
     
 # Define a model for favourite movie preference    
 class FavouriteMovie(BaseModel):
-    movie_id: int
+    movie_id: conint(ge=-2**63, le=2**63 - 1)  # BSON int64, larger ids would only fail when the buffered write is flushed
     
 class searchHistory(BaseModel):
     category: str
@@ -79,6 +934,13 @@ class searchHistory(BaseModel):
 class userSearchHistory(BaseModel):
     history: List[searchHistory]
 
+# Define a model for exchanging or revoking a refresh token
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+# Number of entries kept in the search history and searched movie lists, most recent first
+HISTORY_LENGTH = int(os.getenv("HISTORY_LENGTH", "5"))
+
 # Helper function to hash passwords
 def hash_password(password: str):
     return pwd_context.hash(password)
@@ -86,6 +948,44 @@ def hash_password(password: str):
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
+# Password hashing service
+# bcrypt costs hundreds of milliseconds of CPU, so it runs on a dedicated thread pool instead of the event
+# loop. At most HASH_MAX_CONCURRENCY calls run at once and at most HASH_MAX_QUEUE wait, the rest get a 503
+HASH_MAX_CONCURRENCY = int(os.getenv("HASH_MAX_CONCURRENCY", "4"))
+HASH_MAX_QUEUE = int(os.getenv("HASH_MAX_QUEUE", "32"))
+HASH_RETRY_AFTER_SECONDS = 2
+
+hash_executor = ThreadPoolExecutor(max_workers=HASH_MAX_CONCURRENCY, thread_name_prefix="bcrypt")
+hash_slots = asyncio.Semaphore(HASH_MAX_CONCURRENCY)
+hash_metrics = {"calls": 0, "rejected": 0, "in_flight": 0, "waiting": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+
+async def run_hashing(function, *args):
+    if hash_metrics["waiting"] >= HASH_MAX_QUEUE:
+        hash_metrics["rejected"] += 1
+        raise HTTPException(
+            status_code=503,
+            detail="Too many password requests, please try again shortly",
+            headers={"Retry-After": str(HASH_RETRY_AFTER_SECONDS)}
+        )
+
+    hash_metrics["waiting"] += 1
+    try:
+        await hash_slots.acquire()
+    finally:
+        hash_metrics["waiting"] -= 1
+
+    hash_metrics["in_flight"] += 1
+    started = time.perf_counter()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(hash_executor, function, *args)
+    finally:
+        elapsed = time.perf_counter() - started
+        hash_metrics["in_flight"] -= 1
+        hash_metrics["calls"] += 1
+        hash_metrics["total_seconds"] += elapsed
+        hash_metrics["max_seconds"] = max(hash_metrics["max_seconds"], elapsed)
+        hash_slots.release()
+
 
 # Function to create a JWT token
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -98,6 +998,247 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+# Authenticated user resolution
+# Verified token claims are memoized until the token expires, and user documents are kept for a few seconds
+# so the dashboard's burst of requests costs one read. Writes made by this worker invalidate the cached copy
+TOKEN_CACHE_SIZE = 4096
+USER_CACHE_SIZE = 1024
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "10"))
+
+token_claims_cache = OrderedDict()  # token -> (email, expires at)
+user_cache = OrderedDict()  # email -> (expires at, user document)
+user_cache_generations = defaultdict(int)  # Bumped on invalidation so in-flight reads do not store stale copies
+
+def credentials_exception():
+    return HTTPException(status_code=401, detail="Could not validate credentials")
+
+async def get_current_email(token: str = Depends(oauth2_scheme)):
+    now = time.time()
+    cached = token_claims_cache.get(token)
+    if cached and cached[1] > now:
+        token_claims_cache.move_to_end(token)
+        return cached[0]
+
+    try:
+        # Decode the JWT token to get the user's email
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        email: str = payload.get("sub")
+        if email is None:
+            raise credentials_exception()
+    except JWTError:
+        raise credentials_exception()
+
+    token_claims_cache.pop(token, None)
+    token_claims_cache[token] = (email, payload.get("exp", now))
+    while len(token_claims_cache) > TOKEN_CACHE_SIZE:
+        token_claims_cache.popitem(last=False)
+    return email
+
+async def load_user(email: str):
+    cached = user_cache.get(email)
+    if cached and cached[0] > time.monotonic():
+        user_cache.move_to_end(email)
+        return apply_pending_writes(copy.deepcopy(cached[1]))
+
+    generation = user_cache_generations[email]
+    db_user = await user.find_one({"Email": email})
+    if db_user and user_cache_generations[email] == generation:
+        user_cache.pop(email, None)
+        user_cache[email] = (time.monotonic() + USER_CACHE_TTL_SECONDS, db_user)
+        while len(user_cache) > USER_CACHE_SIZE:
+            user_cache.popitem(last=False)
+    return apply_pending_writes(copy.deepcopy(db_user))
+
+def invalidate_user(email: str):
+    user_cache_generations[email] += 1
+    user_cache.pop(email, None)
+
+async def get_current_user(email: str = Depends(get_current_email)):
+    # Fetch the user from the cache or the database using the email
+    db_user = await load_user(email)
+    if not db_user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return db_user
+
+# Refresh tokens
+# Opaque random tokens, stored only as a sha256 hash and removed by a TTL index once expired. Every refresh
+# rotates the token, and presenting an already used token revokes the whole family it belongs to
+def hash_refresh_token(token: str):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+async def issue_refresh_token(email: str, family: Optional[str] = None):
+    token = secrets.token_urlsafe(32)
+    now = datetime.utcnow()
+    await refresh_tokens.insert_one({
+        "token_hash": hash_refresh_token(token),
+        "email": email,
+        "family": family or secrets.token_hex(16),
+        "created_at": now,
+        "expires_at": now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+        "used_at": None,
+        "revoked": False
+    })
+    return token
+
+async def rotate_refresh_token(token: str):
+    token_hash = hash_refresh_token(token)
+    now = datetime.utcnow()
+
+    # Claim the token atomically, so two requests cannot both rotate it
+    stored = await refresh_tokens.find_one_and_update(
+        {"token_hash": token_hash, "used_at": None, "revoked": False, "expires_at": {"$gt": now}},
+        {"$set": {"used_at": now}}
+    )
+    if stored is None:
+        stored = await refresh_tokens.find_one({"token_hash": token_hash})
+        if stored is not None and (stored["used_at"] is not None or stored["revoked"]):
+            # A used or revoked token came back, assume it was stolen and end the whole session
+            await refresh_tokens.update_many({"family": stored["family"]}, {"$set": {"revoked": True}})
+            logger.warning("Refresh token reuse detected for %s, revoked its session", stored["email"])
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
+
+    return stored["email"], await issue_refresh_token(stored["email"], stored["family"])
+
+async def revoke_refresh_tokens(query: dict):
+    await refresh_tokens.update_many({**query, "revoked": False}, {"$set": {"revoked": True}})
+
+# Write-behind buffer for search telemetry
+# historyupdate and save-searched-movie fire on every search and detail view and are overwritten seconds later,
+# so they are acknowledged right away, coalesced per user and flushed with one bulk_write in the background.
+# Reads made through this worker see the buffered entries on top of the stored document
+WRITE_BEHIND_INTERVAL_SECONDS = float(os.getenv("WRITE_BEHIND_INTERVAL_SECONDS", "2"))
+WRITE_BEHIND_MAX_USERS = int(os.getenv("WRITE_BEHIND_MAX_USERS", "5000"))  # Flush early once this many users are waiting
+
+# Buffered searched movies can still be skipped when they land (already listed or the favourite, at most
+# HISTORY_LENGTH + 1 of them), so enough are kept to fill every slot either way
+PENDING_LIMITS = {"searchHistory": HISTORY_LENGTH, "searchedMovie": 2 * HISTORY_LENGTH + 1}
+
+pending_writes = {}  # email -> {"searchHistory": [entries], "searchedMovie": [ids]}, newest first
+flushing_writes = {}  # The batch currently being written, still overlaid until it lands
+write_behind_wakeup = asyncio.Event()
+write_behind_lock = asyncio.Lock()
+write_behind_metrics = {
+    "queued": 0, "coalesced": 0, "flushes": 0, "flushed_users": 0, "failed_flushes": 0,
+    "total_flush_seconds": 0.0, "last_flush_seconds": 0.0, "max_flush_seconds": 0.0
+}
+
+def queue_history_write(email: str, field: str, value):
+    changes = pending_writes.setdefault(email, {"searchHistory": [], "searchedMovie": []})
+    values = changes[field]
+    write_behind_metrics["queued"] += 1
+
+    if value in values:
+        write_behind_metrics["coalesced"] += 1
+        if field == "searchedMovie":
+            return  # A movie already in the list keeps its place
+        values.remove(value)
+    values.insert(0, value)
+    del values[PENDING_LIMITS[field]:]
+
+    if len(pending_writes) >= WRITE_BEHIND_MAX_USERS:
+        write_behind_wakeup.set()
+
+def merge_history_changes(older, newer):
+    # Same result as queueing every value of older and then every value of newer
+    merged = {"searchHistory": list(newer["searchHistory"]), "searchedMovie": list(newer["searchedMovie"])}
+    merged["searchHistory"] += [entry for entry in older["searchHistory"] if entry not in merged["searchHistory"]]
+    merged["searchedMovie"] = [movie_id for movie_id in newer["searchedMovie"] if movie_id not in older["searchedMovie"]]
+    merged["searchedMovie"] += older["searchedMovie"]
+    for field, values in merged.items():
+        del values[PENDING_LIMITS[field]:]
+    return merged
+
+def apply_history_changes(document, changes):
+    # Python twin of history_update_pipeline, used to overlay buffered writes on reads
+    if changes["searchHistory"]:
+        history = [entry for entry in document.get("searchHistory") or [] if entry not in changes["searchHistory"]]
+        document["searchHistory"] = (changes["searchHistory"] + history)[:HISTORY_LENGTH]
+    if changes["searchedMovie"]:
+        searched = document.get("searchedMovie") or []
+        new_ids = [
+            movie_id for movie_id in changes["searchedMovie"]
+            if movie_id not in searched and movie_id != document.get("favouriteMovie")
+        ]
+        document["searchedMovie"] = (new_ids + searched)[:HISTORY_LENGTH]
+    return document
+
+def apply_pending_writes(document):
+    if document is None:
+        return None
+    for batch in (flushing_writes, pending_writes):
+        if document.get("Email") in batch:
+            apply_history_changes(document, batch[document["Email"]])
+    return document
+
+def history_update_pipeline(changes):
+    # Prepend the buffered entries, drop older copies and keep the first HISTORY_LENGTH entries.
+    # Searched movies already in the list or equal to the favourite are skipped.
+    # $literal keeps search terms starting with $ from being read as field paths
+    stage = {}
+    if changes["searchHistory"]:
+        entries = {"$literal": changes["searchHistory"]}
+        stage["searchHistory"] = {"$slice": [{"$concatArrays": [
+            entries,
+            {"$filter": {"input": {"$ifNull": ["$searchHistory", []]}, "cond": {"$not": {"$in": ["$$this", entries]}}}}
+        ]}, HISTORY_LENGTH]}
+    if changes["searchedMovie"]:
+        searched = {"$ifNull": ["$searchedMovie", []]}
+        stage["searchedMovie"] = {"$slice": [{"$concatArrays": [
+            {"$filter": {"input": {"$literal": changes["searchedMovie"]}, "cond": {"$and": [
+                {"$not": {"$in": ["$$this", searched]}},
+                {"$ne": ["$$this", "$favouriteMovie"]}
+            ]}}},
+            searched
+        ]}, HISTORY_LENGTH]}
+    return [{"$set": stage}]
+
+async def flush_pending_writes():
+    async with write_behind_lock:
+        if not pending_writes:
+            return
+
+        flushing_writes.update(pending_writes)
+        pending_writes.clear()
+        requests = [UpdateOne({"Email": email}, history_update_pipeline(changes)) for email, changes in flushing_writes.items()]
+
+        started = time.perf_counter()
+        try:
+            await user.bulk_write(requests, ordered=False)
+        except (Exception, asyncio.CancelledError) as e:
+            # Put the batch back under anything queued since, the updates are safe to apply twice. Encoding
+            # errors are caught as well, dropping the batch would silently lose every user's changes in it
+            write_behind_metrics["failed_flushes"] += 1
+            for email, changes in flushing_writes.items():
+                pending_writes[email] = merge_history_changes(changes, pending_writes[email]) if email in pending_writes else changes
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            logger.error("Could not flush %d buffered user updates: %s", len(requests), e)
+        else:
+            elapsed = time.perf_counter() - started
+            write_behind_metrics["flushes"] += 1
+            write_behind_metrics["flushed_users"] += len(requests)
+            write_behind_metrics["total_flush_seconds"] += elapsed
+            write_behind_metrics["last_flush_seconds"] = elapsed
+            write_behind_metrics["max_flush_seconds"] = max(write_behind_metrics["max_flush_seconds"], elapsed)
+        finally:
+            for email in flushing_writes:
+                invalidate_user(email)
+            flushing_writes.clear()
+
+async def run_write_behind():
+    current_handler.set("run_write_behind")
+    while True:
+        try:
+            await asyncio.wait_for(write_behind_wakeup.wait(), WRITE_BEHIND_INTERVAL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        write_behind_wakeup.clear()
+        # A failed flush has already requeued its batch, the writer must outlive it
+        try:
+            await flush_pending_writes()
+        except Exception as e:
+            logger.error("Write-behind flush failed: %s", e)
+
 class ProductionCountryResponse(BaseModel):
     name: str
     movieCount: int
@@ -116,6 +1257,24 @@ class ProductionData(BaseModel):
 class ActorFrequencyData(BaseModel):
     actor: str
     frequency: int
+
+# Define a model for the headline movie shown on a KPI card
+class KpiMovie(BaseModel):
+    id: Optional[int]
+    title: Optional[str]
+    AverageRating: Optional[float]
+    popularity: Optional[float]
+    release_date: Optional[str]
+    Director: Optional[str]
+
+# Define a model for the dashboard KPI summary
+class KpiSummary(BaseModel):
+    totalMovies: int
+    averageRuntime: Optional[float]
+    topRatedMovie: Optional[KpiMovie]
+    mostPopularMovie: Optional[KpiMovie]
+    mostFrequentGenre: Optional[str]
+    uniqueLanguages: int
     
 # Pydantic Models
 class Movie(BaseModel):
@@ -162,84 +1321,373 @@ class Movie(BaseModel):
     class Config:
         orm_mode = True
 
+# Define a model for the bulk movie lookup
+class MovieBatchRequest(BaseModel):
+    ids: List[int]
+
+class MovieBatchResponse(BaseModel):
+    movies: List[Movie]
+    missing: List[int]
+
+# Define a model for everything the dashboard needs to know about the signed in user
+SearchHistoryList = List[searchHistory]  # The field below shadows the model name inside the class body
+
+class UserProfile(BaseModel):
+    preferences: List[Component] = []
+    filter: Optional[FilterPreferences]
+    searchHistory: SearchHistoryList = []
+    favouriteMovie: Optional[int]
+    searchedMovie: List[int] = []
+    favouriteMovieDetails: Optional[Movie]
+    searchedMovies: Optional[List[Movie]]
+
+USER_PROFILE_FIELDS = ["preferences", "filter", "searchHistory", "favouriteMovie", "searchedMovie"]
+
+# Named field presets for the fields= parameter of the movie endpoints
+MOVIE_FIELD_PRESETS = {
+    "card": ["id", "title", "release_date", "release_year", "AverageRating", "popularity", "Director", "Poster_Link", "genres_list"],
+    "chart": ["id", "title", "AverageRating", "popularity", "vote_average", "release_year", "revenue"],
+    "detail": list(Movie.__fields__)
+}
+FIELDS_DESCRIPTION = "Comma separated movie fields or presets (card, chart, detail)"
+
+movie_field_models = {}
+
+def parse_movie_fields(fields: Optional[str]):
+    # Expand presets and validate field names, None means the full Movie document
+    if not fields:
+        return None
+
+    field_names = []
+    for name in fields.split(","):
+        name = name.strip()
+        if name in MOVIE_FIELD_PRESETS:
+            field_names.extend(MOVIE_FIELD_PRESETS[name])
+        elif name in Movie.__fields__:
+            field_names.append(name)
+        elif name:
+            raise HTTPException(status_code=400, detail=f"Unknown movie field: {name}")
+    return list(dict.fromkeys(field_names))
+
+def movie_projection(field_names: Optional[List[str]]):
+    if field_names is None:
+        return None
+    return {"_id": 0, **{name: 1 for name in field_names}}
+
+def movie_fields_model(field_names: List[str]):
+    # Trimmed copy of Movie with only the requested fields, built once per field set
+    key = tuple(name for name in Movie.__fields__ if name in field_names)
+    if key not in movie_field_models:
+        movie_field_models[key] = create_model(
+            "MovieFields",
+            **{name: (Optional[Movie.__fields__[name].outer_type_], None) for name in key}
+        )
+    return movie_field_models[key]
+
+def shape_movies(documents, field_names: Optional[List[str]]):
+    # Full Movie models, or trimmed dictionaries when a field set was requested
+    if field_names is None:
+        return [Movie(**document) for document in documents]
+    model = movie_fields_model(field_names)
+    return [model(**document).dict() for document in documents]
+
+# Trusted movie serialization
+# Catalogue documents are written by our own import, so the movie endpoints project the declared fields, copy
+# them into plain dictionaries and encode those straight to JSON bytes. Building a Movie per row and having
+# FastAPI validate it again against the response model is left to STRICT_MOVIE_VALIDATION, a debug mode
+STRICT_MOVIE_VALIDATION = os.getenv("STRICT_MOVIE_VALIDATION", "false").lower() == "true"
+MOVIE_FIELD_NAMES = list(Movie.__fields__)
+# Numbers are coerced to the declared type the way the Movie model did, so 12.0 stored in an int field is still 12
+MOVIE_NUMBER_FIELDS = {name: field.outer_type_ for name, field in Movie.__fields__.items() if field.outer_type_ in (int, float)}
+
+def trusted_projection(field_names: Optional[List[str]], *extra: str):
+    # Extra fields are fetched for cursors and ordering without being returned
+    return movie_projection(list(dict.fromkeys((field_names or MOVIE_FIELD_NAMES) + list(extra))))
+
+def movie_payload(documents, field_names: Optional[List[str]]):
+    if STRICT_MOVIE_VALIDATION:
+        movies = shape_movies(documents, field_names)
+        return [movie.dict() for movie in movies] if field_names is None else movies
+    names = field_names or MOVIE_FIELD_NAMES
+    movies = [{name: document.get(name) for name in names} for document in documents]
+    number_fields = [(name, MOVIE_NUMBER_FIELDS[name]) for name in names if name in MOVIE_NUMBER_FIELDS]
+    for movie in movies:
+        for name, number_type in number_fields:
+            value = movie[name]
+            if type(value) is float and number_type is int and math.isfinite(value):
+                movie[name] = int(value)
+            elif type(value) is int and number_type is float:
+                movie[name] = float(value)
+    return movies
+
+def encode_json(content):
+    if orjson is not None:
+        return orjson.dumps(content, default=str)
+    return json.dumps(content, default=str, separators=(",", ":")).encode()
+
+def encoded_response(content):
+    # Returned as is, FastAPI does not run the response model over a Response
+    return Response(content=encode_json(content), media_type="application/json")
+
+# Define a model for a typeahead suggestion
+class Suggestion(BaseModel):
+    label: str
+    type: str
+    movie_id: Optional[int]
+    popularity: float
+
+SUGGEST_TYPES = ["title", "director", "cast"]
+SUGGEST_DEFAULT_LIMIT = 8
+SUGGEST_MAX_LIMIT = 20
+SUGGEST_CACHED_PREFIX_LENGTH = 3  # Prefixes up to this length are answered from a precomputed table
+
+# Define a model for one keyset page of movies
+class MoviePage(BaseModel):
+    movies: List[Movie]
+    next_cursor: Optional[str]
+
+# Keyset pagination
+# Continuation tokens carry the last sort value and id, so every page is an indexed range query
+MAX_PAGE_SIZE = 1000  # Largest page any movie listing returns
+CURSOR_DESCRIPTION = "Continuation token from next_cursor, pass an empty value for the first page"
+
+def clamp_page_size(limit: Optional[int]):
+    if limit is None or limit <= 0:
+        return MAX_PAGE_SIZE
+    return min(limit, MAX_PAGE_SIZE)
+
+def encode_cursor(sort_by: str, document: dict):
+    token = json.dumps({"s": sort_by, "v": document.get(sort_by), "id": document.get("id")}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(token.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, sort_by: str):
+    try:
+        token = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if token["s"] != sort_by:
+            raise ValueError("cursor belongs to another sort order")
+        return token["v"], token["id"]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def keyset_query(query: dict, sort_by: str, cursor: Optional[str]):
+    # Documents after the cursor in (sort_by desc, id desc) order, null sort values come last
+    if not cursor:
+        return query
+
+    value, last_id = decode_cursor(cursor, sort_by)
+    if value is None:
+        after = {sort_by: None, "id": {"$lt": last_id}}
+    else:
+        after = {"$or": [
+            {sort_by: {"$lt": value}},
+            {sort_by: value, "id": {"$lt": last_id}},
+            {sort_by: None}
+        ]}
+    return {"$and": [query, after]} if query else after
+
+async def fetch_keyset_page(query: dict, sort_by: str, limit: int, cursor: Optional[str], projection: Optional[dict]):
+    # One extra document tells whether another page exists
+    documents = await movies_collection.find(keyset_query(query, sort_by, cursor), projection, comment=request_comment.get()) \
+        .sort([(sort_by, -1), ("id", -1)]).limit(limit + 1).to_list(length=None)
+
+    next_cursor = encode_cursor(sort_by, documents[limit - 1]) if len(documents) > limit else None
+    return documents[:limit], next_cursor
+
+# Streaming NDJSON responses
+# Clients sending "Accept: application/x-ndjson" get one JSON document per line, streamed from the
+# MongoDB cursor in batches, so memory stays flat however many movies match
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+STREAM_BATCH_SIZE = 200  # Documents fetched per cursor batch and written per chunk
+
+def wants_ndjson(request: Request):
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+async def stream_ndjson(documents, encode):
+    try:
+        lines = []
+        async for document in documents:
+            lines.append(encode(document))
+            if len(lines) >= STREAM_BATCH_SIZE:
+                yield "\n".join(lines) + "\n"
+                lines = []
+        if lines:
+            yield "\n".join(lines) + "\n"
+    finally:
+        # Kill the server side cursor if the client went away mid stream
+        if hasattr(documents, "aclose"):
+            await documents.aclose()
+        else:
+            await documents.close()
+
+def ndjson_response(documents, encode):
+    if hasattr(documents, "batch_size"):
+        documents = documents.batch_size(STREAM_BATCH_SIZE)
+    return StreamingResponse(stream_ndjson(documents, encode), media_type=NDJSON_MEDIA_TYPE)
+
+def movie_json(document: dict, field_names: Optional[List[str]]):
+    return encode_json(movie_payload([document], field_names)[0]).decode()
+
 # Movie related API Endpoints
 
-@app.get("/movies", response_model=List[Movie])
+@app.get("/movies", response_model=Union[List[Movie], MoviePage])
+@cached_response
+@admission_control("catalogue")
 async def get_movies(
+    request: Request,
     genre: Optional[str] = Query(None, description="Filter by genre"),
     title: Optional[str] = Query(None, description="Filter by title"),
     year: Optional[int] = Query(None, description="Filter by release year"),
     director: Optional[str] = Query(None, description="Filter by director"),
     sort_by: Optional[str] = Query("vote_average", description="Sort by field"),
     limit: int = Query(1000, description="Limit number of results"),
-    page: int = Query(1, description="Page number")
+    page: int = Query(1, description="Page number"),
+    cursor: Optional[str] = Query(None, description=CURSOR_DESCRIPTION),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION)
 ):
+    field_names = parse_movie_fields(fields)
     query = {}
-    if genre:
-        query["genres_list"] = {"$regex": genre, "$options": "i"} # Case-insensitive regex search
-    if title:
-        query["title"] = {"$regex": title, "$options": "i"}  # Case-insensitive regex search
+
+    # Text filters are resolved against the search index and become indexed lookups
+    if genre or title or director:
+        index = await get_search_index()
+        if genre:
+            # Case-insensitive partial match against the known genre names
+            query["genres_list"] = {"$in": [name for name in index["genres"] if genre.casefold() in name.casefold()]}
+        text_matches = None
+        if title:
+            text_matches = set(search_movie_index(title, SEARCH_CATEGORY_FIELDS["title"]))
+        if director:
+            director_matches = set(search_movie_index(director, SEARCH_CATEGORY_FIELDS["director"]))
+            text_matches = director_matches if text_matches is None else text_matches & director_matches
+        if text_matches is not None:
+            query["id"] = {"$in": list(text_matches)}
     if year:
         query["release_year"] = year
-    if director:
-        query["Director"] = {"$regex": director, "$options": "i"}  # Case-insensitive regex search
+
+    # Streamed exports are not capped by MAX_PAGE_SIZE, limit=0 streams every match
+    if wants_ndjson(request):
+        documents = movies_collection.find(keyset_query(query, sort_by, cursor), trusted_projection(field_names), comment=request_comment.get()) \
+            .sort([(sort_by, -1), ("id", -1)]).limit(max(limit, 0))
+        return ndjson_response(documents, lambda document: movie_json(document, field_names))
+
+    limit = clamp_page_size(limit)
+
+    # Keyset pagination when a cursor is given, the cursor needs the sort field and id of the last row
+    if cursor is not None:
+        projection = trusted_projection(field_names, sort_by, "id")
+        movies, next_cursor = await fetch_keyset_page(query, sort_by, limit, cursor, projection)
+        return encoded_response({"movies": movie_payload(movies, field_names), "next_cursor": next_cursor})
 
     skip = (page - 1) * limit  # Pagination logic
-    cursor = movies_collection.find(query).sort(sort_by, -1).skip(skip).limit(limit)
+    documents = movies_collection.find(query, trusted_projection(field_names), comment=request_comment.get()).sort([(sort_by, -1), ("id", -1)]).skip(skip).limit(limit)
     
     movies = []
-    async for document in cursor:
-        movies.append(Movie(**document))
+    async for document in documents:
+        movies.append(document)
     
-    return movies
+    return encoded_response(movie_payload(movies, field_names))
     
 @app.get("/movie/search")
+@admission_control("search")
 async def search_movies(
+    request: Request,
     category: Optional[str] = Query(None),
     searchTerm: Optional[str] = Query(None),
     genres: Optional[List[str]] = Query(None),
     ratingRange: Optional[str] = Query(None),
-    yearRange: Optional[str] = Query(None)
+    yearRange: Optional[str] = Query(None),
+    limit: Optional[int] = Query(None, description="Page size, capped at MAX_PAGE_SIZE"),
+    cursor: Optional[str] = Query(None, description=CURSOR_DESCRIPTION),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    facets: bool = Query(False, description="Add the total and genre, year and rating facet counts")
 ):
+    field_names = parse_movie_fields(fields)
+    rating_bounds = tuple(map(float, ratingRange.split(','))) if ratingRange else None
+    year_bounds = tuple(map(int, yearRange.split(','))) if yearRange else None
+
+    # Title, director, cast and keyword searches are ranked by the search index, with the other filters applied in memory
+    search_fields = SEARCH_CATEGORY_FIELDS.get(category) if searchTerm else None
+    if search_fields:
+        index = await get_search_index()
+        matched_ids = search_movie_index(searchTerm, search_fields)
+        accept = movie_filter(genres, rating_bounds, year_bounds)
+        ranked_ids = [movie_id for movie_id in matched_ids if accept(index["movies"][movie_id])]
+        result = await ranked_search_response(request, ranked_ids, limit, cursor, field_names)
+        if facets:
+            return with_facets(result, search_facets(ids_to_bitmap(matched_ids), genres, rating_bounds, year_bounds))
+        return result
+
     query = {}
 
     # Handle category-based search
-    if category and searchTerm:
-        if category == "title":
-            query['title'] = {'$regex': searchTerm, '$options': 'i'}  # Case insensitive
-        elif category == "director":
-            query['Director'] = {'$regex': searchTerm, '$options': 'i'}
-        elif category == "year":
-            query['release_year'] = int(searchTerm)
+    if category == "year" and searchTerm:
+        query['release_year'] = int(searchTerm)
 
     # Handle genres filter
     if genres:
         query['genres_list'] = {'$in': genres}  # Match any of the selected genres
 
     # Handle rating range filter
-    if ratingRange:
-        min_rating, max_rating = map(float, ratingRange.split(','))
+    if rating_bounds:
+        min_rating, max_rating = rating_bounds
         query['AverageRating'] = {'$gte': min_rating, '$lte': max_rating}
 
     # Handle year range filter
-    if yearRange:
-        min_year, max_year = map(int, yearRange.split(','))
+    if year_bounds:
+        min_year, max_year = year_bounds
         query['release_year'] = {'$gte': min_year, '$lte': max_year}
 
-    # Fetch results from MongoDB using async cursor
-    movies = []
-    async for document in movies_collection.find(query):
-        movies.append(document)  # Append the document directly
+    # Streamed exports return every match unless a limit is given
+    if wants_ndjson(request):
+        documents = movies_collection.find(keyset_query(query, "id", cursor), movie_projection(field_names), comment=request_comment.get()) \
+            .sort([("id", -1)]).limit(max(limit or 0, 0))
+        return ndjson_response(documents, lambda document: json.dumps(document, default=str))
+
+    limit = clamp_page_size(limit)
+
+    # Keyset pagination by id when a cursor is given
+    next_cursor = None
+    if cursor is not None:
+        projection = movie_projection(field_names + ["id"] if field_names is not None else None)
+        movies, next_cursor = await fetch_keyset_page(query, "id", limit, cursor, projection)
+    else:
+        # Fetch results from MongoDB using async cursor
+        movies = []
+        async for document in movies_collection.find(query, movie_projection(field_names), comment=request_comment.get()).limit(limit):
+            movies.append(document)  # Append the document directly
 
     # Optionally, exclude the MongoDB internal `_id` field
     for movie in movies:
-        movie['_id'] = str(movie['_id'])
+        if '_id' in movie:
+            movie['_id'] = str(movie['_id'])
 
-    return movies
+    result = {"movies": movies, "next_cursor": next_cursor} if cursor is not None else movies
+
+    if facets:
+        # The facets cover the whole catalogue, narrowed to the searched year like the query above
+        index = await get_search_index()
+        bitmaps = index["bitmaps"]
+        base = bitmaps["all"]
+        if category == "year" and searchTerm and not year_bounds:
+            base = bitmaps["years"].get(int(searchTerm), 0)
+        return with_facets(result, search_facets(base, genres, rating_bounds, year_bounds))
+    return result
 
 @app.get("/movies/top-rated", response_model=List[Movie])
-async def get_top_rated_movies(limit: int = 10, filter: str = "highest-rated"):
-    
+@cached_response
+@admission_control("analytics")
+async def get_top_rated_movies(limit: int = 10, filter: str = "highest-rated", fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION)):
+    field_names = parse_movie_fields(fields)
+    top_movies = await fetch_top_rated(limit, filter, field_names)
+    return encoded_response(movie_payload(top_movies, field_names))
+
+async def fetch_top_rated(limit: int, filter: str, field_names: Optional[List[str]]):
+    # Lists up to CHART_TOP_MOVIES_LIMIT long are served from the precomputed chart variants
+    if 0 < limit <= CHART_TOP_MOVIES_LIMIT:
+        variants = await get_chart_variants()
+        movie_ids = variants["top_rated"].get(filter, [])[:limit]
+        return [variants["movies"][movie_id] for movie_id in movie_ids]
+
     if filter == "highest-rated":
         pipeline = [
             {
@@ -279,186 +1727,39 @@ async def get_top_rated_movies(limit: int = 10, filter: str = "highest-rated"):
             }
         ]
     
-    top_movies = await movies_collection.aggregate(pipeline).to_list(length=None)  # Use aggregate with the pipeline
+    pipeline.append({"$project": trusted_projection(field_names)})
 
-    # Convert the raw documents to Movie instances
-    return [Movie(**movie) for movie in top_movies]
+    return await run_aggregate("top_rated", analytics_movies, pipeline)  # Use aggregate with the pipeline
     
     
 @app.get("/movies/pop-vs-rating", response_model=List[PopVsRatingData])
+@cached_response
+@admission_control("analytics")
 async def get_pop_vs_rating(filter: str = "highest-rated"):
-        # Set the pipeline based on the filter type
-    if filter == "highest-rated":
-        pipeline = [
-            # Match movies with non-null ratings and popularity
-            {"$match": {"AverageRating": {"$ne": None}, "popularity": {"$ne": None}}},
-
-            # Group by release_year, calculating the average rating and popularity per year
-            {
-                "$group": {
-                    "_id": "$release_year",  # Directly use release_year field
-                    "avgRating": {"$avg": "$AverageRating"},
-                    "avgPopularity": {"$avg": "$popularity"},
-                    "count": {"$sum": 1}  # Optional: Keeping the count if needed
-                }
-            },
-            # Sort by release_year in ascending order
-            {"$sort": {"_id": 1}}
-        ]
-    
-    else:
-        pipeline = [
-            # Match movies that include the specified genre and have non-null ratings and popularity
-            {"$match": {"genres_list": filter, "AverageRating": {"$ne": None}, "popularity": {"$ne": None}}},
-            
-            # Group by release_year, calculating the average rating and popularity per year for the genre
-            {
-                "$group": {
-                    "_id": "$release_year",  # Directly use release_year field
-                    "avgRating": {"$avg": "$AverageRating"},
-                    "avgPopularity": {"$avg": "$popularity"},
-                    "count": {"$sum": 1}  # Optional: Keeping the count if needed
-                }
-            },
-            # Sort by release_year in ascending order
-            {"$sort": {"_id": 1}}
-        ]
-    
-    # Run the pipeline and get the result
-    result = await movies_collection.aggregate(pipeline).to_list(length=None)
-
-    # Format the result to match the PopVsRatingData model with two decimal places
-    formatted_result = [
-        PopVsRatingData(
-            year=item["_id"], 
-            avgRating=round(item["avgRating"], 2), 
-            avgPopularity=round(item["avgPopularity"], 2),
-            count=item["count"]
-        )
-        for item in result if item["_id"] is not None
-    ]
-
-    return formatted_result
+    variants = await get_chart_variants()
+    return variants["pop_vs_rating"].get(filter, [])
     
 @app.get("/movies/production", response_model=List[ProductionData])
+@cached_response
+@admission_control("analytics")
 async def get_production(filter: str = "highest-rated"):
-    # Define the pipeline based on filter type
-    pipeline = []
-
-    # Default (highest-rated) filter: aggregate by production country
-    if filter == "highest-rated":
-        pipeline = [
-            # Unwind production_countries to handle multiple countries per movie
-            {"$unwind": "$production_countries"},
-            
-            # Match only records with non-null production countries and revenue data
-            {"$match": {"production_countries": {"$nin": [None, "N/A"]}, "revenue": {"$ne": None}}},
-
-            # Group by country, summing up movie count and revenue per country
-            {
-                "$group": {
-                    "_id": "$production_countries",
-                    "movie_count": {"$sum": 1},
-                    "total_revenue": {"$sum": "$revenue"}
-                }
-            },
-
-            # Sort by movie count in descending order and limit to top 5 countries
-            {"$sort": {"movie_count": -1}},
-            {"$limit": 5}
-        ]
-    
-    else:
-        # Genre filter: match specified genre and then aggregate by production country
-        pipeline = [
-            {"$match": {"genres_list": filter, "production_countries": {"$nin": [None, "N/A"]}, "revenue": {"$ne": None}}},
-            {"$unwind": "$production_countries"},
-            {
-                "$group": {
-                    "_id": "$production_countries",
-                    "movie_count": {"$sum": 1},
-                    "total_revenue": {"$sum": "$revenue"}
-                }
-            },
-            {"$sort": {"movie_count": -1}},
-            {"$limit": 5}
-        ]
-    
-    # Execute the pipeline
-    result = await movies_collection.aggregate(pipeline).to_list(length=None)
-
-    # Format the result to match the ProductionData model, ensuring two decimal precision on revenue
-    formatted_result = [
-        ProductionData(
-            country=item["_id"],
-            count=item["movie_count"],
-            totalRevenue=round(item["total_revenue"], 2)
-        )
-        for item in result if item["_id"] is not None
-    ]
-
-    return formatted_result
+    variants = await get_chart_variants()
+    return variants["production"].get(filter, [])
 
 @app.get("/movies/top-actors", response_model=List[ActorFrequencyData])
+@cached_response
+@admission_control("analytics")
 async def get_top_actors(filter: str = "highest-rated"):
-    # Define the pipeline based on filter type
-    pipeline = []
-
-    # Default (highest-rated) filter: aggregate actors from the cast_list
-    if filter == "highest-rated":
-        pipeline = [
-            # Unwind cast_list to handle multiple actors per movie
-            {"$unwind": "$Cast_list"},
-            
-            # Match only records with non-null or valid actors
-            {"$match": {"Cast_list": {"$nin": [None, "Unknown"]}}},
-
-            # Group by actor, summing up the count of appearances
-            {
-                "$group": {
-                    "_id": "$Cast_list",
-                    "actor_count": {"$sum": 1}
-                }
-            },
-
-            # Sort by actor count in descending order and limit to top 5 actors
-            {"$sort": {"actor_count": -1}},
-            {"$limit": 5}
-        ]
-    
-    else:
-        # Genre filter: match specified genre and then aggregate by actors from cast_list
-        pipeline = [
-            {"$match": {"genres_list": filter, "Cast_list": {"$nin": [None, "Unknown"]}}},
-            {"$unwind": "$Cast_list"},
-            {
-                "$group": {
-                    "_id": "$Cast_list",
-                    "actor_count": {"$sum": 1}
-                }
-            },
-            {"$sort": {"actor_count": -1}},
-            {"$limit": 5}
-        ]
-    
-    # Execute the pipeline
-    result = await movies_collection.aggregate(pipeline).to_list(length=None)
-
-    # Format the result to match the ActorFrequencyData model
-    formatted_result = [
-        ActorFrequencyData(
-            actor=item["_id"],
-            frequency=item["actor_count"]
-        )
-        for item in result if item["_id"] is not None
-    ]
-
-    return formatted_result
+    variants = await get_chart_variants()
+    return variants["top_actors"].get(filter, [])
 
 
 
 @app.get("/movies/most-popular", response_model=List[Movie])
-async def get_popular_movies(limit: int = 10):
+@cached_response
+@admission_control("analytics")
+async def get_popular_movies(limit: int = 10, fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION)):
+    field_names = parse_movie_fields(fields)
     pipeline = [
         {
             "$match": {"AverageRating": {"$ne": None}}  # Exclude documents without an average rating
@@ -471,66 +1772,28 @@ async def get_popular_movies(limit: int = 10):
         }
     ]
     
-    popular_movies = await movies_collection.aggregate(pipeline).to_list(length=None)  # Use aggregate with the pipeline
+    pipeline.append({"$project": trusted_projection(field_names)})
 
-    # Convert the raw documents to Movie instances
-    return [Movie(**movie) for movie in popular_movies]
+    popular_movies = await run_aggregate("most_popular", analytics_movies, pipeline)  # Use aggregate with the pipeline
+
+    return encoded_response(movie_payload(popular_movies, field_names))
     
     
 @app.get("/movies/unique-languages", response_model=int)
+@cached_response
+@admission_control("analytics")
 async def get_unique_languages():
-    pipeline = [
-        {
-                "$match": {
-                    "spoken_languages": {"$ne": "N/A"}  # Exclude documents with spoken_languages = "N/A"
-                }
-        },
-        {
-            "$unwind": "$spoken_languages"  # Unwind the array to get individual languages
-        },
-        {
-            "$group": {
-                "_id": "$spoken_languages",  # Group by language
-            }
-        },
-        {
-            "$count": "unique_language_count"  # Count the unique languages
-        }
-    ]
-
-    result = await movies_collection.aggregate(pipeline).to_list(length=None)
+    result = await get_rollup("unique_languages")
 
     # Return the count of unique languages or 0 if none are found
     return result[0]['unique_language_count'] if result else 0
     
 @app.get("/movies/production-country", response_model=List[ProductionCountryResponse])
+@cached_response
+@admission_control("analytics")
 async def get_production_country_counts():
     try:
-        pipeline = [
-            {
-                "$match": {
-                    "production_countries": {"$ne": "N/A"}  # Exclude documents with production_countries = "N/A"
-                }
-            },
-            {
-                "$unwind": "$production_countries"  # Deconstruct the production_countries array
-            },
-            {
-                "$group": {
-                    "_id": "$production_countries",  # Group by production country
-                    "movieCount": {"$sum": 1}  # Count the number of movies
-                }
-            },
-            {
-                "$project": {
-                    "name": "$_id",  # Rename _id to name
-                    "movieCount": 1,
-                    "_id": 0  # Exclude the _id field
-                }
-            }
-        ]
-
-        results = await movies_collection.aggregate(pipeline).to_list(length=None)  # Execute the aggregation
+        results = await get_rollup("production_country")  # Served from the materialized rollup
         return results
 
     except Exception as e:
@@ -539,75 +1802,272 @@ async def get_production_country_counts():
 
 
 @app.get("/movies/genre-breakdown")
+@cached_response
+@admission_control("analytics")
 async def get_genre_breakdown():
-    pipeline = [
-        {
-            "$match": {
-                "genres_list": {"$ne": "Unknown"}  # Exclude documents with genres_list = "Unknown"
-            }
-        },
-        {"$unwind": "$genres_list"},
-        {"$group": {"_id": "$genres_list", "count": {"$sum": 1}}},
-        {"$sort": {"count": -1}}
-    ]
-    results = await movies_collection.aggregate(pipeline).to_list(length=None)
-    return results
+    return await get_rollup("genre_breakdown")
 
 @app.get("/movies/releases-over-time")
+@cached_response
+@admission_control("analytics")
 async def get_releases_over_time():
+    return await get_rollup("releases_over_time")
+
+async def compute_kpis(session=None):
+    kpi_movie_fields = {"_id": 0, "id": 1, "title": 1, "AverageRating": 1, "popularity": 1, "release_date": 1, "Director": 1}
     pipeline = [
         {
-            "$group": {
-                "_id": "$release_year",
-                "revenue": {"$sum": "$revenue"},  # Summing up the revenue field
-                "count": {"$sum": 1}  # Optional: Keeping the count if needed
+            "$facet": {
+                "totalMovies": [{"$count": "count"}],
+                "averageRuntime": [
+                    {"$group": {"_id": None, "avgRuntime": {"$avg": "$runtime"}}}  # $avg skips null runtimes
+                ],
+                "topRatedMovie": [
+                    {"$match": {"AverageRating": {"$ne": None}}},
+                    {"$sort": {"AverageRating": -1}},
+                    {"$limit": 1},
+                    {"$project": kpi_movie_fields}
+                ],
+                "mostPopularMovie": [
+                    {"$match": {"AverageRating": {"$ne": None}}},
+                    {"$sort": {"popularity": -1}},
+                    {"$limit": 1},
+                    {"$project": kpi_movie_fields}
+                ],
+                "mostFrequentGenre": [
+                    {"$match": {"genres_list": {"$ne": "Unknown"}}},
+                    {"$unwind": "$genres_list"},
+                    {"$group": {"_id": "$genres_list", "count": {"$sum": 1}}},
+                    {"$sort": {"count": -1}},
+                    {"$limit": 1}
+                ],
+                "uniqueLanguages": [
+                    {"$match": {"spoken_languages": {"$ne": "N/A"}}},
+                    {"$unwind": "$spoken_languages"},
+                    {"$group": {"_id": "$spoken_languages"}},
+                    {"$count": "count"}
+                ]
             }
-        },
-        {"$sort": {"_id": 1}}  # Sorting by year
+        }
     ]
-    results = await movies_collection.aggregate(pipeline).to_list(length=None)
-    return results
+
+    result = await run_aggregate("kpis", analytics_movies, pipeline, length=1, session=session)
+    facets = result[0] if result else {}
+
+    def first(name):
+        items = facets.get(name) or []
+        return items[0] if items else None
+
+    total = first("totalMovies")
+    runtime = first("averageRuntime")
+    genre = first("mostFrequentGenre")
+    languages = first("uniqueLanguages")
+
+    return KpiSummary(
+        totalMovies=total["count"] if total else 0,
+        averageRuntime=round(runtime["avgRuntime"], 2) if runtime and runtime["avgRuntime"] is not None else None,
+        topRatedMovie=first("topRatedMovie"),
+        mostPopularMovie=first("mostPopularMovie"),
+        mostFrequentGenre=genre["_id"] if genre else None,
+        uniqueLanguages=languages["count"] if languages else 0
+    )
+
+@app.get("/movies/kpis", response_model=KpiSummary)
+@cached_response
+@admission_control("analytics")
+async def get_movie_kpis():
+    return await get_rollup("kpis")
+
+MAX_BATCH_IDS = 100  # Most movies a single batch lookup may ask for
+
+async def fetch_movies_by_ids(movie_ids: List[int], field_names: Optional[List[str]] = None):
+    # One $in query for all IDs, returned in request order with the IDs that were not found
+    movie_ids = list(dict.fromkeys(movie_ids))  # Drop duplicates, keep order
+    if len(movie_ids) > MAX_BATCH_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_IDS} movie IDs per request")
+
+    # The id is always projected, it is needed to restore the request order
+    projection = trusted_projection(field_names, "id")
+
+    found = {}
+    async for document in movies_collection.find({"id": {"$in": movie_ids}}, projection, comment=request_comment.get()):
+        found[document["id"]] = document
+
+    movies = movie_payload([found[movie_id] for movie_id in movie_ids if movie_id in found], field_names)
+    missing = [movie_id for movie_id in movie_ids if movie_id not in found]
+
+    return {"movies": movies, "missing": missing}
+
+@app.get("/movies/batch", response_model=MovieBatchResponse)
+@cached_response
+@admission_control("catalogue")
+async def get_movies_batch(
+    ids: List[str] = Query(..., description="Movie IDs, comma separated or repeated"),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION)
+):
+    try:
+        movie_ids = [int(movie_id) for value in ids for movie_id in value.split(",") if movie_id.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Movie IDs must be integers")
+
+    return encoded_response(await fetch_movies_by_ids(movie_ids, parse_movie_fields(fields)))
+
+@app.post("/movies/batch", response_model=MovieBatchResponse)
+@admission_control("catalogue")
+async def post_movies_batch(batch: MovieBatchRequest, fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION)):
+    return encoded_response(await fetch_movies_by_ids(batch.ids, parse_movie_fields(fields)))
+
+@app.get("/movies/suggest", response_model=List[Suggestion])
+@admission_control("catalogue")
+async def suggest_movies(
+    q: str = Query(..., description="Prefix typed so far"),
+    type: Optional[str] = Query(None, description="Only suggest one kind: title, director or cast"),
+    limit: int = Query(SUGGEST_DEFAULT_LIMIT, ge=1, le=SUGGEST_MAX_LIMIT)
+):
+    if type is not None and type not in SUGGEST_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unknown suggestion type: {type}")
+
+    index = await get_suggest_index()
+    return lookup_suggestions(index, q, type or "all", limit)
 
 @app.get("/movies/{movie_id}", response_model=Movie)
-async def get_movie(movie_id: int):
-    movie = await movies_collection.find_one({"id": movie_id})
+@cached_response
+@admission_control("catalogue")
+async def get_movie(movie_id: int, fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION)):
+    field_names = parse_movie_fields(fields)
+    movie = await movies_collection.find_one({"id": movie_id}, trusted_projection(field_names), comment=request_comment.get())
     if movie:
-        return Movie(**movie)
+        return encoded_response(movie_payload([movie], field_names)[0])
     raise HTTPException(status_code=404, detail="Movie not found")
     
 @app.get("/movies/actors/frequency")
+@cached_response
+@admission_control("analytics")
 async def actor_frequency():
-    pipeline = [
+    return await get_rollup("actor_frequency")
+
+
+@app.get("/movies/ratings/distribution")
+@cached_response
+@admission_control("analytics")
+async def ratings_distribution():
+    return await get_rollup("ratings_distribution")
+
+# Dashboard composition
+# The dashboard widgets each used to call their own endpoint, /dashboard runs the ones a user can see
+# concurrently and returns them in one payload. A failing widget is reported without failing the rest
+CHART_DEFAULT_FILTER = "highest-rated"
+
+async def top_rated_widget():
+    return movie_payload(await fetch_top_rated(10, CHART_DEFAULT_FILTER, None), None)
+
+async def multi_chart_widget():
+    top_rated, pop_vs_rating, production, top_actors = await asyncio.gather(
+        top_rated_widget(),
+        get_pop_vs_rating(filter=CHART_DEFAULT_FILTER),
+        get_production(filter=CHART_DEFAULT_FILTER),
+        get_top_actors(filter=CHART_DEFAULT_FILTER)
+    )
+    return {"top_rated": top_rated, "pop_vs_rating": pop_vs_rating, "production": production, "top_actors": top_actors}
+
+DASHBOARD_WIDGETS = {
+    "kpis": get_movie_kpis,
+    "genre_breakdown": get_genre_breakdown,
+    "actor_frequency": actor_frequency,
+    "releases_over_time": get_releases_over_time,
+    "ratings_distribution": ratings_distribution,
+    "top_rated": top_rated_widget,
+    "production_country": get_production_country_counts,
+    "multi_chart": multi_chart_widget
+}
+
+# Preference component id -> widget it shows, the other components only need the user profile
+PREFERENCE_WIDGETS = {
+    "2": "kpis",
+    "3": "genre_breakdown",
+    "4": "actor_frequency",
+    "5": "releases_over_time",
+    "6": "ratings_distribution",
+    "9": "top_rated",
+    "10": "production_country",
+    "12": "multi_chart"
+}
+
+async def run_dashboard_widget(name: str):
+    started = time.perf_counter()
+    try:
+        result = {"status": "ok", "data": await DASHBOARD_WIDGETS[name]()}
+    except Exception as e:
+        logger.error("Dashboard widget %s failed: %s", name, e)
+        result = {"status": "error", "error": e.detail if isinstance(e, HTTPException) else str(e)}
+    result["duration_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return name, result
+
+@app.get("/dashboard")
+async def get_dashboard(
+    widgets: Optional[str] = Query(None, description="Comma separated widget names, defaults to the user's visible widgets"),
+    token: Optional[str] = Depends(optional_oauth2_scheme)
+):
+    started = time.perf_counter()
+
+    if widgets:
+        names = list(dict.fromkeys(name.strip() for name in widgets.split(",") if name.strip()))
+        unknown = [name for name in names if name not in DASHBOARD_WIDGETS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown dashboard widgets: {', '.join(unknown)}")
+    elif token:
+        # Only the widgets the signed in user has switched on
+        db_user = await get_current_user(await get_current_email(token))
+        names = list(dict.fromkeys(
+            PREFERENCE_WIDGETS[component["id"]] for component in db_user.get("preferences", [])
+            if component.get("isVisible") and component.get("id") in PREFERENCE_WIDGETS
+        ))
+    else:
+        names = list(DASHBOARD_WIDGETS)
+
+    results = await asyncio.gather(*(run_dashboard_widget(name) for name in names))
+
+    return {
+        "widgets": dict(results),
+        "duration_ms": round((time.perf_counter() - started) * 1000, 2)
+    }
+
+# Materialized analytics rollups
+# The dashboard aggregations only change when the catalogue is reloaded, so they are computed once per
+# dataset version, persisted in the movie_stats collection and served from an in-process snapshot
+stats_collection = db["movie_stats"]
+version_probe = movies_collection.with_options(read_concern=ReadConcern("majority"))  # Primary, like the loaders' writes
+dataset_meta = db["dataset_meta"]  # {"_id": "catalogue", "generation": n}, bumped by loaders and the admin rebuild
+STATS_REFRESH_INTERVAL_SECONDS = 60  # How often to check whether the catalogue has changed
+
+ROLLUP_PIPELINES = {
+    "genre_breakdown": [
         {
-                "$match": {
-                    "Cast_list": {"$ne": "Unknown"}  # Exclude documents with production_countries = "N/A"
-                }
+            "$match": {
+                "genres_list": {"$ne": "Unknown"}  # Exclude documents with genres_list = "Unknown"
+            }
         },
-        {"$unwind": "$Cast_list"},  # Unwind the cast list to get individual actors
-        {"$unwind": "$genres_list"},  # Unwind the genres list to get individual genres
+        {"$unwind": "$genres_list"},
+        {"$group": {"_id": "$genres_list", "count": {"$sum": 1}}},
+        {"$sort": {"count": -1}}
+    ],
+    "releases_over_time": [
         {
             "$group": {
-                "_id": {"actor": "$Cast_list", "genre": "$genres_list"},  # Group by both actor and genre
-                "count": {"$sum": 1}  # Count the occurrences
+                "_id": "$release_year",
+                "revenue": {"$sum": "$revenue"},  # Summing up the revenue field
+                "count": {"$sum": 1}  # Optional: Keeping the count if needed
             }
         },
-        {"$sort": {"count": -1}},  # Sort by count
-        {"$limit": 50}  # Limit to top 50 combinations of actor-genre
-    ]
-    frequency = await movies_collection.aggregate(pipeline).to_list(None)
-    #print(f"Document Retrieved: {frequency}")  # Debugging output
-    return frequency
-
-
-@app.get("/movies/ratings/distribution")
-async def ratings_distribution():
-    pipeline = [
+        {"$sort": {"_id": 1}}  # Sorting by year
+    ],
+    "ratings_distribution": [
         # Match documents that have a valid AverageRating and non-empty genres_list
         {"$match": {"AverageRating": {"$ne": None}, "genres_list": {"$ne": []}}},
 
         # Unwind the genres_list so we can group by individual genres
         {"$unwind": "$genres_list"},
-        
+
         # Group by genre and calculate the highest rating and count of movies in each genre
         {
             "$group": {
@@ -616,15 +2076,629 @@ async def ratings_distribution():
                 "count": {"$sum": 1}  # Count of movies in each genre
             }
         },
-        
+
         # Sort by genre name (alphabetically)
-        {"$sort": {"_id": 1}}  
+        {"$sort": {"_id": 1}}
+    ],
+    "production_country": [
+        {
+            "$match": {
+                "production_countries": {"$ne": "N/A"}  # Exclude documents with production_countries = "N/A"
+            }
+        },
+        {
+            "$unwind": "$production_countries"  # Deconstruct the production_countries array
+        },
+        {
+            "$group": {
+                "_id": "$production_countries",  # Group by production country
+                "movieCount": {"$sum": 1}  # Count the number of movies
+            }
+        },
+        {
+            "$project": {
+                "name": "$_id",  # Rename _id to name
+                "movieCount": 1,
+                "_id": 0  # Exclude the _id field
+            }
+        }
+    ],
+    "unique_languages": [
+        {
+            "$match": {
+                "spoken_languages": {"$ne": "N/A"}  # Exclude documents with spoken_languages = "N/A"
+            }
+        },
+        {
+            "$unwind": "$spoken_languages"  # Unwind the array to get individual languages
+        },
+        {
+            "$group": {
+                "_id": "$spoken_languages",  # Group by language
+            }
+        },
+        {
+            "$count": "unique_language_count"  # Count the unique languages
+        }
+    ],
+    "actor_frequency": [
+        {
+            "$match": {
+                "Cast_list": {"$ne": "Unknown"}  # Exclude documents with Cast_list = "Unknown"
+            }
+        },
+        {"$unwind": "$Cast_list"},  # Unwind the cast list to get individual actors
+        {"$unwind": "$genres_list"},  # Unwind the genres list to get individual genres
+        {
+            "$group": {
+                "_id": {"actor": "$Cast_list", "genre": "$genres_list"},  # Group by both actor and genre
+                "count": {"$sum": 1}  # Count the occurrences
+            }
+        },
+        {"$sort": {"count": -1}},  # Sort by count
+        {"$limit": 50}  # Limit to top 50 combinations of actor-genre
     ]
+}
+
+stats_snapshot = {"version": None, "built_at": None, "rollups": {}}
+stats_lock = asyncio.Lock()
+
+async def get_dataset_version(session=None):
+    # Cheap fingerprint of the catalogue: document count, newest ObjectId, newest updated_at and the catalogue
+    # generation. Count and ObjectId catch appends, updated_at catches in-place edits by writers that maintain
+    # it, and anything else (deletes followed by inserts, bulk rewrites) must call bump_dataset_generation
+    # The count cannot run in a session, the reads after it anchor the session at or past its cluster time
+    count = await version_probe.estimated_document_count()
+    latest = await version_probe.find_one({}, {"_id": 1}, sort=[("_id", -1)], session=session)
+    edited = await version_probe.find_one({"updated_at": {"$ne": None}}, {"_id": 0, "updated_at": 1}, sort=[("updated_at", -1)], session=session)
+    meta = await dataset_meta.find_one({"_id": "catalogue"}, session=session)
+    return "-".join([
+        str(count),
+        str(latest["_id"]) if latest else "empty",
+        str(edited["updated_at"]) if edited else "unedited",
+        str(meta["generation"] if meta else 0)
+    ])
+
+async def bump_dataset_generation():
+    # Forces a new dataset version, every worker rebuilds its rollups, indexes and cached responses
+    meta = await dataset_meta.find_one_and_update(
+        {"_id": "catalogue"}, {"$inc": {"generation": 1}}, upsert=True, return_document=ReturnDocument.AFTER
+    )
+    return meta["generation"]
+
+async def build_movie_stats(version: str, session=None):
+    rollups = {}
+    for name, pipeline in ROLLUP_PIPELINES.items():
+        rollups[name] = await run_aggregate(name, analytics_movies, pipeline, session=session)
+    rollups["kpis"] = (await compute_kpis(session)).dict()
+
+    stats = {"_id": version, "built_at": datetime.utcnow(), "rollups": rollups}
+    await stats_collection.replace_one({"_id": version}, stats, upsert=True)
+
+    # Rollups of previous dataset versions are no longer needed
+    await stats_collection.delete_many({"_id": {"$ne": version}})
+    return stats
+
+async def refresh_movie_stats(force: bool = False):
+    async with stats_lock, await client.start_session(causal_consistency=True) as session:
+        # Every build below reads at least what this version read saw, whichever member serves it
+        version = await get_dataset_version(session)
+        stats = None
+        if force or stats_snapshot["version"] != version:
+            # Another worker may already have materialized this dataset version
+            stats = None if force else await stats_collection.find_one({"_id": version})
+            if stats is None:
+                logger.info("Building movie stats for dataset version %s", version)
+                stats = await build_movie_stats(version, session)
+
+        # Everything is built before anything is swapped in, so the snapshot version behind the ETags never
+        # runs ahead of the charts, search and typeahead structures it stands for
+        variants = await build_chart_variants(version, session) if force or chart_variants["version"] != version else None
+        index = await build_search_index(version, session) if force or search_index["version"] != version else None
+        suggestions = await build_suggest_index(version, session) if force or suggest_index["version"] != version else None
+
+        previous_version = stats_snapshot["version"]
+        if stats is not None:
+            stats_snapshot.update(version=version, built_at=stats["built_at"], rollups=stats["rollups"])
+        for structure, built in ((chart_variants, variants), (search_index, index), (suggest_index, suggestions)):
+            if built is not None:
+                structure.update(built)
+
+        # Cached responses were computed from the previous dataset version
+        if previous_version is not None and stats is not None:
+            response_cache.clear()
+        return stats_snapshot
+
+async def load_movie_stats():
+    # First use before the background refresh finished, concurrent callers share one refresh
+    await single_flight("refresh_movie_stats", None, refresh_movie_stats, copy_result=False)
+
+async def get_rollup(name: str):
+    if stats_snapshot["version"] is None:
+        await load_movie_stats()
+    return stats_snapshot["rollups"][name]
+
+async def watch_movie_stats():
+    # Build the snapshot at startup, then rebuild it whenever the dataset version changes
+    current_handler.set("watch_movie_stats")
+    while True:
+        try:
+            await refresh_movie_stats()
+        except Exception as e:
+            logger.warning("Could not refresh movie stats: %s", e)
+        await asyncio.sleep(STATS_REFRESH_INTERVAL_SECONDS)
+
+# Precomputed MultiChart variants
+# A single pass over the catalogue builds the top-rated, pop-vs-rating, production and top-actors series
+# for every genre plus the global filters, so switching the MultiChart filter never runs an aggregation
+CHART_TOP_MOVIES_LIMIT = 50  # Longest top-rated list kept in memory, larger limits query MongoDB
+CHART_TOP_GROUPS_LIMIT = 5  # Countries and actors shown per chart
+
+chart_variants = {"version": None, "movies": {}, "top_rated": {}, "pop_vs_rating": {}, "production": {}, "top_actors": {}}
+
+def as_list(value):
+    # Mirror $unwind: missing and null values produce nothing, scalars produce a single item
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+def push_top(heap, key, movie_id):
+    # Keep the CHART_TOP_MOVIES_LIMIT largest keys in a min-heap
+    if len(heap) < CHART_TOP_MOVIES_LIMIT:
+        heapq.heappush(heap, (key, movie_id))
+    elif (key, movie_id) > heap[0]:
+        heapq.heapreplace(heap, (key, movie_id))
+
+async def build_chart_variants(version: str, session=None):
+    projection = {
+        "_id": 0, "id": 1, "AverageRating": 1, "popularity": 1, "release_year": 1,
+        "genres_list": 1, "production_countries": 1, "revenue": 1, "Cast_list": 1
+    }
+    top_rated = defaultdict(list)  # filter -> heap of (sort key, movie id)
+    years = defaultdict(lambda: defaultdict(lambda: [0.0, 0.0, 0]))  # filter -> year -> [rating sum, popularity sum, count]
+    countries = defaultdict(lambda: defaultdict(lambda: [0, 0]))  # filter -> country -> [movie count, revenue]
+    actors = defaultdict(Counter)  # filter -> actor -> appearances
+
+    async for movie in analytics_movies.find({}, projection, session=session):
+        movie_id = movie.get("id")
+        rating = movie.get("AverageRating")
+        popularity = movie.get("popularity")
+        year = movie.get("release_year")
+        revenue = movie.get("revenue")
+        genres = set(as_list(movie.get("genres_list")))
+        movie_countries = as_list(movie.get("production_countries"))
+        cast = as_list(movie.get("Cast_list"))
+
+        # Top rated: global filters skip missing values, genres sort missing ratings last like MongoDB does
+        if rating is not None:
+            push_top(top_rated["highest-rated"], (1, rating), movie_id)
+        if popularity is not None:
+            push_top(top_rated["popularity"], (1, popularity), movie_id)
+        for genre in genres:
+            push_top(top_rated[genre], (1, rating) if rating is not None else (0, 0), movie_id)
+
+        # Average rating and popularity per release year
+        if rating is not None and popularity is not None and year is not None:
+            for key in ["highest-rated", *genres]:
+                bucket = years[key][year]
+                bucket[0] += rating
+                bucket[1] += popularity
+                bucket[2] += 1
+
+        # Movie count and revenue per production country
+        if revenue is not None:
+            for country in movie_countries:
+                if country not in (None, "N/A"):
+                    countries["highest-rated"][country][0] += 1
+                    countries["highest-rated"][country][1] += revenue
+            if movie.get("production_countries") is not None and not any(country in (None, "N/A") for country in movie_countries):
+                for genre in genres:
+                    for country in movie_countries:
+                        countries[genre][country][0] += 1
+                        countries[genre][country][1] += revenue
+
+        # Actor appearances
+        actors["highest-rated"].update(actor for actor in cast if actor not in (None, "Unknown"))
+        if movie.get("Cast_list") is not None and not any(actor in (None, "Unknown") for actor in cast):
+            for genre in genres:
+                actors[genre].update(cast)
+
+    # Fetch every movie that made a top-rated list in one query
+    top_rated_ids = {key: [movie_id for _, movie_id in sorted(heap, reverse=True)] for key, heap in top_rated.items()}
+    wanted_ids = list({movie_id for movie_ids in top_rated_ids.values() for movie_id in movie_ids})
+    movies = {}
+    async for movie in analytics_movies.find({"id": {"$in": wanted_ids}}, session=session):
+        movies[movie["id"]] = movie
+
+    return {
+        "version": version,
+        "movies": movies,
+        "top_rated": {key: [movie_id for movie_id in movie_ids if movie_id in movies] for key, movie_ids in top_rated_ids.items()},
+        "pop_vs_rating": {
+            key: [
+                PopVsRatingData(
+                    year=year,
+                    avgRating=round(rating_sum / count, 2),
+                    avgPopularity=round(popularity_sum / count, 2),
+                    count=count
+                )
+                for year, (rating_sum, popularity_sum, count) in sorted(per_year.items())
+            ]
+            for key, per_year in years.items()
+        },
+        "production": {
+            key: [
+                ProductionData(country=country, count=count, totalRevenue=round(revenue, 2))
+                for country, (count, revenue) in sorted(per_country.items(), key=lambda item: item[1][0], reverse=True)[:CHART_TOP_GROUPS_LIMIT]
+            ]
+            for key, per_country in countries.items()
+        },
+        "top_actors": {
+            key: [ActorFrequencyData(actor=actor, frequency=count) for actor, count in counter.most_common(CHART_TOP_GROUPS_LIMIT)]
+            for key, counter in actors.items()
+        }
+    }
+
+async def get_chart_variants():
+    if chart_variants["version"] is None:
+        await load_movie_stats()
+    return chart_variants
+
+# Full-text movie search
+# An inverted index over titles, directors, cast and keywords is rebuilt with every dataset version, so
+# searches are dictionary lookups with relevance ranking instead of unanchored $regex collection scans.
+# Every token matches the words it starts, so unlike the old $regex a fragment from the middle of a word
+# ("atrix") no longer finds it
+SEARCH_FIELD_WEIGHTS = {"title": 3.0, "original_title": 2.0, "Director": 2.0, "Cast_list": 1.0, "keywords": 1.0}
+SEARCH_CATEGORY_FIELDS = {
+    "title": ["title", "original_title"],
+    "director": ["Director"],
+    "cast": ["Cast_list"],
+    "keywords": ["keywords"]
+}
+SEARCH_MAX_EXPANSIONS = 64  # Most index terms a single prefix expands to, the most frequent are kept
+SEARCH_PREFIX_WEIGHT = 0.5  # Score factor for a prefix match compared to a whole word match
+
+class IndexedMovie(NamedTuple):
+    genres: frozenset
+    rating: Optional[float]
+    year: Optional[int]
+    popularity: float
+
+search_index = {"version": None, "movies": {}, "postings": {}, "terms": {}, "genres": [], "bitmaps": {}}
+
+def tokenize(text: str):
+    # Case and accent insensitive word tokens
+    text = unicodedata.normalize("NFKD", text.casefold())
+    return re.findall(r"\w+", "".join(char for char in text if not unicodedata.combining(char)))
+
+async def build_search_index(version: str, session=None):
+    projection = {"_id": 0, "id": 1, "genres_list": 1, "AverageRating": 1, "release_year": 1, "popularity": 1}
+    projection.update({field: 1 for field in SEARCH_FIELD_WEIGHTS})
+    postings = {field: defaultdict(set) for field in SEARCH_FIELD_WEIGHTS}
+    movies = {}
+
+    async for movie in analytics_movies.find({}, projection, session=session):
+        movie_id = movie.get("id")
+        if movie_id is None:
+            continue
+        movies[movie_id] = IndexedMovie(
+            genres=frozenset(as_list(movie.get("genres_list"))),
+            rating=movie.get("AverageRating"),
+            year=movie.get("release_year"),
+            popularity=movie.get("popularity") or 0.0
+        )
+        for field in SEARCH_FIELD_WEIGHTS:
+            for value in as_list(movie.get(field)):
+                if isinstance(value, str):
+                    for term in tokenize(value):
+                        postings[field][term].add(movie_id)
+
+    return {
+        "version": version,
+        "movies": movies,
+        "postings": {field: dict(terms) for field, terms in postings.items()},
+        "terms": {field: sorted(terms) for field, terms in postings.items()},
+        "genres": sorted({genre for movie in movies.values() for genre in movie.genres if isinstance(genre, str)}),
+        "bitmaps": build_facet_bitmaps(movies)
+    }
+
+async def get_search_index():
+    if search_index["version"] is None:
+        await load_movie_stats()
+    return search_index
+
+def expand_term(field: str, token: str):
+    # Whole word match plus index terms starting with the token
+    terms = search_index["terms"][field]
+    postings = search_index["postings"][field]
+    start = position = bisect_left(terms, token)
+    while position < len(terms) and terms[position].startswith(token):
+        position += 1
+
+    matches = terms[start:position]
+    if len(matches) > SEARCH_MAX_EXPANSIONS:
+        # Short prefixes such as a single letter keep the terms covering the most movies
+        matches = heapq.nlargest(SEARCH_MAX_EXPANSIONS, matches, key=lambda term: (term == token, len(postings[term])))
+    return matches
+
+def movie_filter(genres=None, rating_bounds=None, year_bounds=None):
+    # Combine the optional genre, rating and year filters into one predicate over indexed movies
+    checks = []
+    if genres:
+        wanted_genres = set(genres)
+        checks.append(lambda movie: not wanted_genres.isdisjoint(movie.genres))
+    if rating_bounds:
+        min_rating, max_rating = rating_bounds
+        checks.append(lambda movie: movie.rating is not None and min_rating <= movie.rating <= max_rating)
+    if year_bounds:
+        min_year, max_year = year_bounds
+        checks.append(lambda movie: movie.year is not None and min_year <= movie.year <= max_year)
+    return lambda movie: all(check(movie) for check in checks)
+
+def search_movie_index(text: str, fields: List[str], accept=None):
+    # Every token must match one of the fields, results are ranked by relevance then popularity
+    movies = search_index["movies"]
+    total = len(movies) or 1
+    scores = None
+
+    for token in tokenize(text):
+        token_scores = defaultdict(float)
+        for field in fields:
+            field_scores = {}
+            for term in expand_term(field, token):
+                movie_ids = search_index["postings"][field][term]
+                weight = SEARCH_FIELD_WEIGHTS[field] * math.log(1 + total / len(movie_ids))
+                if term != token:
+                    weight *= SEARCH_PREFIX_WEIGHT
+                for movie_id in movie_ids:
+                    if weight > field_scores.get(movie_id, 0.0):
+                        field_scores[movie_id] = weight
+            for movie_id, weight in field_scores.items():
+                token_scores[movie_id] += weight
+
+        if scores is None:
+            scores = token_scores
+        else:
+            scores = {movie_id: score + token_scores[movie_id] for movie_id, score in scores.items() if movie_id in token_scores}
+        if not scores:
+            return []
+
+    if scores is None:
+        return []
+
+    matches = [movie_id for movie_id in scores if accept is None or accept(movies[movie_id])]
+    return sorted(matches, key=lambda movie_id: (-scores[movie_id], -movies[movie_id].popularity))
+
+# Search facets
+# Every indexed movie owns one bit, and each genre, release year and rating bucket keeps a Python int with
+# the bits of its movies. Facet counts are AND + popcount over those ints instead of extra aggregations.
+# Each facet is counted with every filter applied except its own, so the UI can offer the alternatives
+YEAR_BUCKET_SIZE = 10  # Years per release_year facet bucket
+RATING_BUCKETS = range(10)  # Whole-star AverageRating buckets, the last one includes 10
+
+def to_bitmap(positions, size: int):
+    data = bytearray(size // 8 + 1)
+    for position in positions:
+        data[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(data, "little")
+
+def popcount(bits: int):
+    return bin(bits).count("1")
+
+def rating_bucket(rating: float):
+    return min(int(rating), RATING_BUCKETS[-1])
+
+def build_facet_bitmaps(movies: dict):
+    size = len(movies)
+    genres, years, decades, ratings = defaultdict(list), defaultdict(list), defaultdict(list), defaultdict(list)
+    for position, movie in enumerate(movies.values()):
+        for genre in movie.genres:
+            if isinstance(genre, str):
+                genres[genre].append(position)
+        if isinstance(movie.year, int):
+            years[movie.year].append(position)
+            decades[movie.year // YEAR_BUCKET_SIZE * YEAR_BUCKET_SIZE].append(position)
+        if isinstance(movie.rating, (int, float)) and not math.isnan(movie.rating):
+            ratings[rating_bucket(movie.rating)].append(position)
+
+    return {
+        "positions": {movie_id: position for position, movie_id in enumerate(movies)},
+        "size": size,
+        "all": (1 << size) - 1,
+        "genres": {genre: to_bitmap(members, size) for genre, members in genres.items()},
+        "years": {year: to_bitmap(members, size) for year, members in years.items()},
+        "decades": {decade: to_bitmap(members, size) for decade, members in sorted(decades.items())},
+        "ratings": {bucket: to_bitmap(members, size) for bucket, members in sorted(ratings.items())},
+        # Positions per bucket and ratings per position, to check the buckets a range only partly covers
+        "rating_members": dict(ratings),
+        "rating_values": [movie.rating for movie in movies.values()]
+    }
+
+def facet_masks(genres=None, rating_bounds=None, year_bounds=None):
+    # One bitmap per active filter, same semantics as movie_filter
+    bitmaps = search_index["bitmaps"]
+    masks = {}
+    if genres:
+        masks["genres"] = 0
+        for genre in genres:
+            masks["genres"] |= bitmaps["genres"].get(genre, 0)
+    if year_bounds:
+        min_year, max_year = year_bounds
+        masks["years"] = 0
+        for year, bits in bitmaps["years"].items():
+            if min_year <= year <= max_year:
+                masks["years"] |= bits
+    if rating_bounds:
+        min_rating, max_rating = rating_bounds
+        rating_values = bitmaps["rating_values"]
+        masks["ratings"] = 0
+        for bucket, bits in bitmaps["ratings"].items():
+            if min_rating <= bucket and bucket + 1 <= max_rating:
+                masks["ratings"] |= bits
+            elif bucket <= max_rating and bucket + 1 >= min_rating:
+                members = [
+                    position for position in bitmaps["rating_members"][bucket]
+                    if min_rating <= rating_values[position] <= max_rating
+                ]
+                masks["ratings"] |= to_bitmap(members, bitmaps["size"])
+    return masks
+
+def search_facets(base: int, genres=None, rating_bounds=None, year_bounds=None):
+    bitmaps = search_index["bitmaps"]
+    masks = facet_masks(genres, rating_bounds, year_bounds)
+
+    def scope(excluded=None):
+        bits = base
+        for name, mask in masks.items():
+            if name != excluded:
+                bits &= mask
+        return bits
+
+    def counts(name, buckets, label):
+        bits = scope(name)
+        result = [{"value": label(key), "count": popcount(bits & bucket_bits)} for key, bucket_bits in buckets.items()]
+        return [bucket for bucket in result if bucket["count"]]
+
+    genre_counts = counts("genres", bitmaps["genres"], lambda genre: genre)
+    genre_counts.sort(key=lambda bucket: (-bucket["count"], bucket["value"]))
+
+    return {
+        "total": popcount(scope()),
+        "facets": {
+            "genres": genre_counts,
+            "years": counts("years", bitmaps["decades"], lambda decade: f"{decade}-{decade + YEAR_BUCKET_SIZE - 1}"),
+            "ratings": counts("ratings", bitmaps["ratings"], lambda bucket: f"{bucket}-{bucket + 1}")
+        }
+    }
+
+def ids_to_bitmap(movie_ids: List[int]):
+    bitmaps = search_index["bitmaps"]
+    return to_bitmap((bitmaps["positions"][movie_id] for movie_id in movie_ids), bitmaps["size"])
+
+def with_facets(result, facets: dict):
+    # Streamed responses carry no envelope to put the facets in
+    if isinstance(result, Response):
+        return result
+    envelope = result if isinstance(result, dict) else {"movies": result}
+    envelope.update(facets)
+    return envelope
+
+async def fetch_ranked_movies(movie_ids: List[int], projection: Optional[dict]):
+    # One $in query, returned in ranking order
+    if projection is not None:
+        projection = {**projection, "id": 1}
+    found = {}
+    async for document in movies_collection.find({"id": {"$in": movie_ids}}, projection, comment=request_comment.get()):
+        found[document["id"]] = document
+    return [found[movie_id] for movie_id in movie_ids if movie_id in found]
+
+async def iter_ranked_movies(movie_ids: List[int], projection: Optional[dict]):
+    for start in range(0, len(movie_ids), STREAM_BATCH_SIZE):
+        for document in await fetch_ranked_movies(movie_ids[start:start + STREAM_BATCH_SIZE], projection):
+            yield document
+
+async def ranked_search_response(request: Request, ranked_ids: List[int], limit: Optional[int], cursor: Optional[str], field_names: Optional[List[str]]):
+    projection = movie_projection(field_names)
+
+    if wants_ndjson(request):
+        if limit:
+            ranked_ids = ranked_ids[:limit]
+        return ndjson_response(iter_ranked_movies(ranked_ids, projection), lambda document: json.dumps(document, default=str))
+
+    # Ranked pages are addressed by their offset in the result list
+    limit = clamp_page_size(limit)
+    offset = decode_cursor(cursor, "_score")[0] if cursor else 0
+    if type(offset) is not int or offset < 0:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    page_ids = ranked_ids[offset:offset + limit]
+    movies = await fetch_ranked_movies(page_ids, projection)
+
+    for movie in movies:
+        if '_id' in movie:
+            movie['_id'] = str(movie['_id'])
 
-    # Execute the aggregation pipeline
-    distribution = await movies_collection.aggregate(pipeline).to_list(length=None)
+    if cursor is not None:
+        has_more = offset + limit < len(ranked_ids)
+        next_cursor = encode_cursor("_score", {"_score": offset + limit, "id": page_ids[-1]}) if has_more else None
+        return {"movies": movies, "next_cursor": next_cursor}
+    return movies
+
+# Typeahead suggestions
+# Titles, directors and cast names live in sorted key arrays searched with bisect, and the most common
+# short prefixes have their top suggestions precomputed, so typeahead never reaches MongoDB
+suggest_index = {"version": None, "suggestions": [], "lookups": {}}
+
+def build_prefix_lookup(keyed_ids, suggestions):
+    # Sorted (key, suggestion id) pairs plus the best SUGGEST_MAX_LIMIT suggestions for every short prefix
+    keyed_ids.sort()
+    short_prefixes = defaultdict(set)
+    for key, suggestion_id in keyed_ids:
+        for length in range(1, min(len(key), SUGGEST_CACHED_PREFIX_LENGTH) + 1):
+            short_prefixes[key[:length]].add(suggestion_id)
+
+    def by_popularity(suggestion_id):
+        return suggestions[suggestion_id].popularity
+
+    return {
+        "keys": [key for key, _ in keyed_ids],
+        "ids": [suggestion_id for _, suggestion_id in keyed_ids],
+        "short_prefixes": {
+            prefix: heapq.nlargest(SUGGEST_MAX_LIMIT, suggestion_ids, key=by_popularity)
+            for prefix, suggestion_ids in short_prefixes.items()
+        }
+    }
 
-    return distribution
+async def build_suggest_index(version: str, session=None):
+    projection = {"_id": 0, "id": 1, "title": 1, "Director": 1, "Cast_list": 1, "popularity": 1}
+    titles = []
+    people = {"director": {}, "cast": {}}  # type -> name -> highest popularity of their movies
+
+    async for movie in analytics_movies.find({}, projection, session=session):
+        popularity = movie.get("popularity") or 0.0
+        if isinstance(movie.get("title"), str):
+            titles.append((movie["title"], movie.get("id"), popularity))
+        for kind, names in [("director", as_list(movie.get("Director"))), ("cast", as_list(movie.get("Cast_list")))]:
+            for name in names:
+                if isinstance(name, str) and name not in ("Unknown", "N/A"):
+                    people[kind][name] = max(people[kind].get(name, 0.0), popularity)
+
+    suggestions = [Suggestion(label=title, type="title", movie_id=movie_id, popularity=popularity) for title, movie_id, popularity in titles]
+    for kind, names in people.items():
+        suggestions.extend(Suggestion(label=name, type=kind, movie_id=None, popularity=popularity) for name, popularity in names.items())
+
+    # Every word start is a key, so "godf" finds "The Godfather"
+    keyed_ids = {kind: [] for kind in SUGGEST_TYPES}
+    for suggestion_id, suggestion in enumerate(suggestions):
+        words = tokenize(suggestion.label)
+        for start in range(len(words)):
+            keyed_ids[suggestion.type].append((" ".join(words[start:]), suggestion_id))
+
+    lookups = {kind: build_prefix_lookup(pairs, suggestions) for kind, pairs in keyed_ids.items()}
+    lookups["all"] = build_prefix_lookup([pair for pairs in keyed_ids.values() for pair in pairs], suggestions)
+
+    return {"version": version, "suggestions": suggestions, "lookups": lookups}
+
+async def get_suggest_index():
+    if suggest_index["version"] is None:
+        await load_movie_stats()
+    return suggest_index
+
+def lookup_suggestions(index, text: str, kind: str, limit: int):
+    prefix = " ".join(tokenize(text))
+    if not prefix:
+        return []
+
+    suggestions = index["suggestions"]
+    lookup = index["lookups"][kind]
+    if len(prefix) <= SUGGEST_CACHED_PREFIX_LENGTH:
+        return [suggestions[suggestion_id] for suggestion_id in lookup["short_prefixes"].get(prefix, [])[:limit]]
+
+    start = bisect_left(lookup["keys"], prefix)
+    end = bisect_left(lookup["keys"], prefix + "\uffff")
+    suggestion_ids = set(lookup["ids"][start:end])
+    best = heapq.nlargest(limit, suggestion_ids, key=lambda suggestion_id: suggestions[suggestion_id].popularity)
+    return [suggestions[suggestion_id] for suggestion_id in best]
 
 # User Related API Endpoint
 
@@ -640,7 +2714,7 @@ async def register(register_request: UserRegister):
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Hash the password before storing it
-    hashed_password = hash_password(RegisterPassword)
+    hashed_password = await run_hashing(hash_password, RegisterPassword)
     
     # Insert the user data into the database
     new_user = {
@@ -666,11 +2740,8 @@ async def register(register_request: UserRegister):
         },
         "favouriteMovie": 0,
         "searchHistory": [
-            {"category": "", "searchTerm": "", "selectedGenre": "", "ratingRange": "", "yearRange":""},
-            {"category": "", "searchTerm": "", "selectedGenre": "", "ratingRange": "", "yearRange":""},
-            {"category": "", "searchTerm": "", "selectedGenre": "", "ratingRange": "", "yearRange":""},
-            {"category": "", "searchTerm": "", "selectedGenre": "", "ratingRange": "", "yearRange":""},
             {"category": "", "searchTerm": "", "selectedGenre": "", "ratingRange": "", "yearRange":""}
+            for _ in range(HISTORY_LENGTH)
         ],
         "searchedMovie": []
     }
@@ -691,66 +2762,64 @@ async def login(user_login: UserLogin):  # Rename the input variable to avoid co
         raise HTTPException(status_code=400, detail="Invalid email or password")
 
     # Verify the password directly
-    if not verify_password(LoginPassword, db_user["Password"]):  # Compare plain password with hashed password
+    if not await run_hashing(verify_password, LoginPassword, db_user["Password"]):  # Compare plain password with hashed password
         raise HTTPException(status_code=400, detail="Invalid email or password")
     
-    # Create JWT token
+    # Create JWT token and the refresh token that renews it without the password
     access_token = create_access_token(data={"sub": user_login.email})
-    return {"access_token": access_token, "token_type": "bearer"}
+    refresh_token = await issue_refresh_token(user_login.email)
+    return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
+
+#Exchange a refresh token for a new access token
+@app.post("/movie/refresh")
+async def refresh_access_token(refresh_request: RefreshRequest):
+    email, refresh_token = await rotate_refresh_token(refresh_request.refresh_token)
+    access_token = create_access_token(data={"sub": email})
+    return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
+
+#Logout, revoking the session's refresh tokens
+@app.post("/movie/logout")
+async def logout(refresh_request: RefreshRequest):
+    stored = await refresh_tokens.find_one({"token_hash": hash_refresh_token(refresh_request.refresh_token)})
+    if stored is not None:
+        await revoke_refresh_tokens({"family": stored["family"]})
+    return {"msg": "Logged out"}
 
 
 #User Change password
 @app.post("/movie/change-password")
-async def change_password(change_password: ChangePassword, token: str = Depends(oauth2_scheme)):
-    try:
-        # Decode the JWT token to get the user's email
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise HTTPException(status_code=401, detail="Could not validate credentials")
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Could not validate credentials")
+async def change_password(change_password: ChangePassword, email: str = Depends(get_current_email)):
     
-    #print(email)
-    # Fetch the user from the database using the email
+    # Fetch the user from the database, the cached copy may hold an outdated password hash
     db_user = await user.find_one({"Email": email})
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
     
     # Verify the old password
-    if not verify_password(change_password.oldPassword, db_user["Password"]):
+    if not await run_hashing(verify_password, change_password.oldPassword, db_user["Password"]):
         raise HTTPException(status_code=400, detail="Old password is incorrect")
     
     # Hash the new password
-    new_hashed_password = hash_password(change_password.newPassword)
+    new_hashed_password = await run_hashing(hash_password, change_password.newPassword)
     
     # Update the password in the database
     await user.update_one({"Email": email}, {"$set": {"Password": new_hashed_password}})
+    invalidate_user(email)
+
+    # End every session once its access token expires, they have to log in with the new password
+    await revoke_refresh_tokens({"email": email})
     
     return {"msg": "Password updated successfully"}
     
 #User Update Preference
 @app.post("/movie/update-user-preference")
-async def update_preference(preferences: UserPreferences, token: str = Depends(oauth2_scheme)):
-    try:
-        # Decode the JWT token to get the user's email
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise HTTPException(status_code=401, detail="Could not validate credentials")
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Could not validate credentials")
-
-    # Fetch the user from the database using the email
-    db_user = await user.find_one({"Email": email})
-    if not db_user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
+async def update_preference(preferences: UserPreferences, db_user: dict = Depends(get_current_user)):
     # Update the user's preferences in the database
     update_result = await user.update_one(
-        {"Email": email},  # Find user by email
+        {"Email": db_user["Email"]},  # Find user by email
         {"$set": {"preferences": preferences.dict()["components"]}}  # Update preferences
     )
+    invalidate_user(db_user["Email"])
 
     # Check if the update was successful
     if update_result.modified_count == 0:
@@ -760,21 +2829,7 @@ async def update_preference(preferences: UserPreferences, token: str = Depends(o
 
 #Get preference    
 @app.get("/movie/user-preferences", response_model=UserPreferences)
-async def get_preference(token: str = Depends(oauth2_scheme)):
-    try:
-        # Decode the JWT token to get the user's email
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise HTTPException(status_code=401, detail="Could not validate credentials")
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Could not validate credentials")
-
-    # Fetch the user from the database using the email
-    db_user = await user.find_one({"Email": email})
-    if not db_user:
-        raise HTTPException(status_code=404, detail="User not found")
-
+async def get_preference(db_user: dict = Depends(get_current_user)):
     # Retrieve components from the user preferences
     components_data = db_user.get("preferences", [])
     
@@ -789,26 +2844,16 @@ async def get_preference(token: str = Depends(oauth2_scheme)):
     
 #Save Filter
 @app.post("/movie/save-filter")
-async def save_filter(preferences: FilterPreferences, token: str = Depends(oauth2_scheme)):
-    try:
-        # Decode the JWT token to get the user's email
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise HTTPException(status_code=401, detail="Could not validate credentials")
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Could not validate credentials")
-
-    # Fetch the user from the database using the email
-    db_user = await user.find_one({"Email": email})
-    if not db_user:
-        raise HTTPException(status_code=404, detail="User not found")
-        
+async def save_filter(preferences: FilterPreferences, email: str = Depends(get_current_email)):
     # Update the user's filter in the database
     update_result = await user.update_one(
         {"Email": email},  # Find user by email
         {"$set": {"filter": {"genres": preferences.genres, "year": preferences.year}}}  # Update preferences
     )
+    invalidate_user(email)
+
+    if update_result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="User not found")
 
     if update_result.modified_count == 0:
         raise HTTPException(status_code=400, detail="Filter preferences not updated")
@@ -817,21 +2862,7 @@ async def save_filter(preferences: FilterPreferences, token: str = Depends(oauth
     
 #Get saved Filter
 @app.get("/movie/getfilter", response_model=FilterPreferences)
-async def get_filter(token: str = Depends(oauth2_scheme)):
-    try:
-        # Decode the JWT token to get the user's email
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise HTTPException(status_code=401, detail="Could not validate credentials")
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Could not validate credentials")
-
-    # Fetch the user from the database using the email
-    db_user = await user.find_one({"Email": email})
-    if not db_user:
-        raise HTTPException(status_code=404, detail="User not found")
-        
+async def get_filter(db_user: dict = Depends(get_current_user)):
     # Retrieve filter from the user preferences
     filter_data = db_user.get("filter", {})
     
@@ -843,21 +2874,7 @@ async def get_filter(token: str = Depends(oauth2_scheme)):
 
 #Get search history
 @app.get("/movie/history-data", response_model=List[searchHistory])
-async def get_history(token: str = Depends(oauth2_scheme)):
-    try:
-        # Decode the JWT token to get the user's email
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise HTTPException(status_code=401, detail="Could not validate credentials")
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Could not validate credentials")
-
-    # Fetch the user from the database using the email
-    db_user = await user.find_one({"Email": email})
-    if not db_user:
-        raise HTTPException(status_code=404, detail="User not found")
-
+async def get_history(db_user: dict = Depends(get_current_user)):
     # Fetch the search history
     searchData = db_user.get("searchHistory", [])
     
@@ -869,81 +2886,34 @@ async def get_history(token: str = Depends(oauth2_scheme)):
  
 #Update append search history 
 @app.post("/movie/historyupdate")
-async def update_history(history: userSearchHistory, token: str = Depends(oauth2_scheme)):
-    try:
-        # Decode the JWT token to get the user's email
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise HTTPException(status_code=401, detail="Could not validate credentials")
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Could not validate credentials")
-
-    # Fetch the user from the database using the email
-    db_user = await user.find_one({"Email": email})
-    if not db_user:
-        raise HTTPException(status_code=404, detail="User not found")
-
-    # Update search history and limit to 5 entries
-    new_search_history = db_user.get("searchHistory", [])
-    
-     # Prepend the new history to the front of the list
-    new_search_history.insert(0, {
-        "category": history.history[-1].category, 
+async def update_history(history: userSearchHistory, email: str = Depends(get_current_email)):
+    entry = {
+        "category": history.history[-1].category,
         "searchTerm": history.history[-1].searchTerm,
         "selectedGenre": history.history[-1].selectedGenre,
         "ratingRange": history.history[-1].ratingRange,
         "yearRange": history.history[-1].yearRange
-    })
-
-    # Keep only the last 5 entries in search history
-    if len(new_search_history) > 5:
-        new_search_history = new_search_history[:5]  # Keep only the first 5 entries
+    }
 
-    # Update the user document with the new search history
-    await user.update_one({"Email": email}, {"$set": {"searchHistory": new_search_history}})
+    # Acknowledge right away, the entry is written with the next write-behind flush
+    queue_history_write(email, "searchHistory", entry)
 
     return {"msg": "Search history updated"}
     
 @app.post("/movie/save-fav-movie")
-async def update_favorite_movie(movie: FavouriteMovie, token: str = Depends(oauth2_scheme)):
-    try:
-        # Decode the JWT token to get the user's email
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise HTTPException(status_code=401, detail="Could not validate credentials")
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Could not validate credentials")
+async def update_favorite_movie(movie: FavouriteMovie, email: str = Depends(get_current_email)):
+    # Update the movie ID in the database
+    update_result = await user.update_one({"Email": email}, {"$set": {"favouriteMovie": movie.movie_id}})
+    invalidate_user(email)
 
-    # Fetch the user from the database using the email
-    db_user = await user.find_one({"Email": email})
-    if not db_user:
+    if update_result.matched_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
-        
-    # Update the movie ID in the database
-    await user.update_one({"Email": email}, {"$set": {"favouriteMovie": movie.movie_id}})
 
     return {"msg": "Favorite movie updated successfully"}
 
 #Get Favourite Movie ID
 @app.get("/movie/favmovie", response_model=FavouriteMovie)
-async def get_fav_movie(token: str = Depends(oauth2_scheme)):
-    try:
-        # Decode the JWT token to get the user's email
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise HTTPException(status_code=401, detail="Could not validate credentials")
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Could not validate credentials")
-
-    #print (email)
-    # Fetch the user from the database using the email
-    db_user = await user.find_one({"Email": email})
-    if not db_user:
-        raise HTTPException(status_code=404, detail="User not found")
-
+async def get_fav_movie(db_user: dict = Depends(get_current_user)):
     # Fetch the favorite movie ID
     favorite_movie_id = db_user.get("favouriteMovie")
     
@@ -958,21 +2928,7 @@ async def get_fav_movie(token: str = Depends(oauth2_scheme)):
 
 # Get Searched Movie IDs
 @app.get("/movie/searched")
-async def get_searched_movies(token: str = Depends(oauth2_scheme)):
-    try:
-        # Decode the JWT token to get the user's email
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise HTTPException(status_code=401, detail="Could not validate credentials")
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Could not validate credentials")
-
-    # Fetch the user from the database using the email
-    db_user = await user.find_one({"Email": email})
-    if not db_user:
-        raise HTTPException(status_code=404, detail="User not found")
-
+async def get_searched_movies(embed: bool = Query(False, description="Include the movie documents"), db_user: dict = Depends(get_current_user)):
     # Fetch the searchedMovie list
     searched_movie_ids = db_user.get("searchedMovie")
 
@@ -980,47 +2936,234 @@ async def get_searched_movies(token: str = Depends(oauth2_scheme)):
     if searched_movie_ids is None or not isinstance(searched_movie_ids, list):
         raise HTTPException(status_code=404, detail="No valid searched movies found")
 
+    # Optionally embed the movies so the client does not need one request per ID
+    if embed:
+        batch = await fetch_movies_by_ids(searched_movie_ids)
+        return {"searchedMovie": searched_movie_ids, **batch}
+
     # Return the searched movie IDs as a JSON response
     return {"searchedMovie": searched_movie_ids}
     
     
  #Post Searched Movie ID
 @app.post("/movie/save-searched-movie")
-async def update_searched_movie(movie: FavouriteMovie, token: str = Depends(oauth2_scheme)):
-    try:
-        # Decode the JWT token to get the user's email
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise HTTPException(status_code=401, detail="Could not validate credentials")
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Could not validate credentials")
-
-    # Fetch the user from the database using the email
-    db_user = await user.find_one({"Email": email})
-    if not db_user:
+async def update_searched_movie(movie: FavouriteMovie, email: str = Depends(get_current_email)):
+    # Acknowledge right away, the movie_id is written with the next write-behind flush. Movies already in
+    # searchedMovie or equal to favouriteMovie are skipped when it lands
+    queue_history_write(email, "searchedMovie", movie.movie_id)
+
+    return {"msg": "Search history updated successfully"}
+
+#Get the whole user profile in one request
+@app.get("/movie/me", response_model=UserProfile, response_model_exclude_none=True)
+async def get_me(
+    embed: bool = Query(False, description="Include the favourite and searched movie documents"),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    email: str = Depends(get_current_email)
+):
+    field_names = parse_movie_fields(fields)
+    projection = {"_id": 0, **{name: 1 for name in USER_PROFILE_FIELDS}}
+
+    if not embed:
+        db_user = await user.find_one({"Email": email}, {**projection, "Email": 1})
+        if not db_user:
+            raise HTTPException(status_code=404, detail="User not found")
+        return UserProfile(**apply_pending_writes(db_user))
+
+    # Join the favourite, searched and still buffered movies in the same round trip
+    buffered_ids = [
+        movie_id for batch in (flushing_writes, pending_writes)
+        for movie_id in batch.get(email, {}).get("searchedMovie", [])
+    ]
+    projection["Email"] = 1
+    if field_names is None:
+        projection["movies"] = 1
+    else:
+        projection.update({f"movies.{name}": 1 for name in field_names + ["id"]})
+    pipeline = [
+        {"$match": {"Email": email}},
+        {"$limit": 1},
+        {"$addFields": {"movieIds": {"$concatArrays": [
+            {"$ifNull": ["$searchedMovie", []]},
+            {"$literal": buffered_ids},
+            {"$cond": [{"$isNumber": "$favouriteMovie"}, ["$favouriteMovie"], []]}
+        ]}}},
+        {"$lookup": {"from": movies_collection.name, "localField": "movieIds", "foreignField": "id", "as": "movies"}},
+        {"$project": projection}
+    ]
+    documents = await run_aggregate("user_profile", user, pipeline, length=1)
+    if not documents:
         raise HTTPException(status_code=404, detail="User not found")
-        
-        
-    # Fetch the current search history and favorite movie
-    searched_movie = db_user.get("searchedMovie", [])
-    favourite_movie = db_user.get("favouriteMovie", None)  # Assume it's an int (movie_id)
 
-    # Check if the movie_id already exists in searchedMovie or favouriteMovie
-    if movie.movie_id in searched_movie:
-        return {"msg": "Movie already exists in search history"}
-    
-    if favourite_movie == movie.movie_id:
-        return {"msg": "Movie already exists in favorite history"}
+    db_user = apply_pending_writes(documents[0])
+    found = {movie["id"]: movie for movie in db_user.pop("movies", [])}
+    searched = [found[movie_id] for movie_id in db_user.get("searchedMovie") or [] if movie_id in found]
+    favourite = [found[db_user["favouriteMovie"]]] if db_user.get("favouriteMovie") in found else []
+
+    if field_names is not None:
+        content = UserProfile(**db_user).dict(exclude_none=True)
+        content["searchedMovies"] = shape_movies(searched, field_names)
+        if favourite:
+            content["favouriteMovieDetails"] = shape_movies(favourite, field_names)[0]
+        return JSONResponse(content=content)
+
+    return UserProfile(
+        **db_user,
+        favouriteMovieDetails=favourite[0] if favourite else None,
+        searchedMovies=searched
+    )
 
-    # Insert the new movie_id at the start of the search history
-    searched_movie.insert(0, movie.movie_id)
+# Admin API Endpoint
+
+#Prometheus metrics
+def format_labels(names: tuple, values: tuple):
+    if not names:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for value in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+def metric_family(lines: list, name: str, kind: str, description: str, names: tuple, samples):
+    lines.append(f"# HELP {name} {description}")
+    lines.append(f"# TYPE {name} {kind}")
+    for values, value in samples:
+        lines.append(f"{name}{format_labels(names, values)} {value}")
+
+def histogram_lines(lines: list, name: str, names: tuple, series: dict):
+    for values, histogram in series.items():
+        cumulative = 0
+        for bound, count in zip(METRIC_BUCKETS, histogram["buckets"]):
+            cumulative += count
+            lines.append(f"{name}_bucket{format_labels(names + ('le',), values + (bound,))} {cumulative}")
+        lines.append(f"{name}_bucket{format_labels(names + ('le',), values + ('+Inf',))} {histogram['count']}")
+        lines.append(f"{name}_sum{format_labels(names, values)} {histogram['sum']}")
+        lines.append(f"{name}_count{format_labels(names, values)} {histogram['count']}")
+
+def render_prometheus_metrics():
+    lines = []
+    with metric_lock:
+        snapshot = copy.deepcopy(metric_series)
+
+    for name, (kind, description, names) in METRIC_DEFINITIONS.items():
+        series = snapshot.get(name, {})
+        if kind == "histogram":
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} histogram")
+            histogram_lines(lines, name, names, series)
+        else:
+            metric_family(lines, name, kind, description, names, series.items())
+
+    # Counters the API already kept for its /metrics/* endpoints
+    metric_family(lines, "password_hashing_calls_total", "counter", "Password hashes and verifications", (), [((), hash_metrics["calls"])])
+    metric_family(lines, "password_hashing_rejected_total", "counter", "Password requests shed with a 503", (), [((), hash_metrics["rejected"])])
+    metric_family(lines, "password_hashing_seconds_total", "counter", "Time spent hashing passwords", (), [((), hash_metrics["total_seconds"])])
+    metric_family(lines, "password_hashing_in_flight", "gauge", "Password hashes running or queued", ("state",),
+                  [(("running",), hash_metrics["in_flight"]), (("waiting",), hash_metrics["waiting"])])
+
+    metric_family(lines, "write_behind_pending_users", "gauge", "Users with buffered search telemetry", (), [((), len(pending_writes))])
+    metric_family(lines, "write_behind_events_total", "counter", "Buffered search telemetry writes", ("event",),
+                  [((event,), write_behind_metrics[event]) for event in ("queued", "coalesced", "flushes", "flushed_users", "failed_flushes")])
+    metric_family(lines, "write_behind_flush_seconds_total", "counter", "Time spent flushing buffered writes", (), [((), write_behind_metrics["total_flush_seconds"])])
+
+    metric_family(lines, "single_flight_in_flight", "gauge", "Coalesced calls currently running", (), [((), len(inflight_calls))])
+    metric_family(lines, "single_flight_calls_total", "counter", "Single-flight calls by outcome", ("name", "outcome"),
+                  [((name, outcome), counters[outcome]) for name, counters in single_flight_metrics.items() for outcome in ("executed", "coalesced", "failed")])
+
+    metric_family(lines, "response_cache_entries", "gauge", "Cached /movies responses", (), [((), len(response_cache))])
+    metric_family(lines, "response_cache_requests_total", "counter", "Cached endpoint requests by outcome", ("outcome",),
+                  [((outcome,), response_cache_metrics[outcome]) for outcome in ("hits", "stale", "misses", "unavailable")])
+    metric_family(lines, "mongodb_breaker_state", "gauge", "MongoDB circuit breaker, 0 closed, 1 half-open, 2 open", (),
+                  [((), ["closed", "half-open", "open"].index(mongo_breaker["state"]))])
+    metric_family(lines, "mongodb_breaker_trips_total", "counter", "Times the MongoDB circuit breaker opened", (), [((), breaker_metrics["trips"])])
+
+    metric_family(lines, "admission_requests_total", "counter", "Admission control decisions", ("handler", "outcome"),
+                  [((handler, outcome), counters[outcome]) for handler, counters in admission_metrics.items() for outcome in ("admitted", "rejected", "timed_out", "cancelled")])
+    metric_family(lines, "admission_queue_depth", "gauge", "Requests waiting for an admission slot", ("handler",),
+                  [((handler,), counters["waiting"]) for handler, counters in admission_metrics.items()])
+    return "\n".join(lines) + "\n"
+
+@app.get("/metrics")
+async def get_prometheus_metrics():
+    return Response(content=render_prometheus_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+#Password hashing metrics
+@app.get("/metrics/hashing")
+async def get_hash_metrics():
+    calls = hash_metrics["calls"]
+    return {
+        "calls": calls,
+        "rejected": hash_metrics["rejected"],
+        "in_flight": hash_metrics["in_flight"],
+        "waiting": hash_metrics["waiting"],
+        "avg_ms": round(hash_metrics["total_seconds"] / calls * 1000, 2) if calls else 0.0,
+        "max_ms": round(hash_metrics["max_seconds"] * 1000, 2),
+        "max_concurrency": HASH_MAX_CONCURRENCY,
+        "max_queue": HASH_MAX_QUEUE
+    }
 
-    # Limit the history to the last 5 movie_ids
-    if len(searched_movie) > 5:
-        searched_movie = searched_movie[:5]
+#Write-behind buffer metrics
+@app.get("/metrics/write-behind")
+async def get_write_behind_metrics():
+    flushes = write_behind_metrics["flushes"]
+    return {
+        "pending_users": len(pending_writes),
+        "pending_entries": sum(len(values) for changes in pending_writes.values() for values in changes.values()),
+        "flushing_users": len(flushing_writes),
+        "queued": write_behind_metrics["queued"],
+        "coalesced": write_behind_metrics["coalesced"],
+        "flushes": flushes,
+        "flushed_users": write_behind_metrics["flushed_users"],
+        "failed_flushes": write_behind_metrics["failed_flushes"],
+        "avg_flush_ms": round(write_behind_metrics["total_flush_seconds"] / flushes * 1000, 2) if flushes else 0.0,
+        "last_flush_ms": round(write_behind_metrics["last_flush_seconds"] * 1000, 2),
+        "max_flush_ms": round(write_behind_metrics["max_flush_seconds"] * 1000, 2),
+        "interval_seconds": WRITE_BEHIND_INTERVAL_SECONDS
+    }
 
-    # Update the user document with the new search history
-    await user.update_one({"Email": email}, {"$set": {"searchedMovie": searched_movie}})
-    
-    return {"msg": "Search history updated successfully"}
\ No newline at end of file
+#Single-flight coalescing metrics
+@app.get("/metrics/single-flight")
+async def get_single_flight_metrics():
+    return {
+        "in_flight": len(inflight_calls),
+        "calls": sum(metrics["calls"] for metrics in single_flight_metrics.values()),
+        "coalesced": sum(metrics["coalesced"] for metrics in single_flight_metrics.values()),
+        "by_name": single_flight_metrics
+    }
+
+#Response cache and MongoDB circuit breaker metrics
+@app.get("/metrics/response-cache")
+async def get_response_cache_metrics():
+    served = response_cache_metrics["hits"] + response_cache_metrics["stale"] + response_cache_metrics["misses"]
+    return {
+        "entries": len(response_cache),
+        "revalidating": len(revalidating),
+        **response_cache_metrics,
+        "hit_ratio": round((response_cache_metrics["hits"] + response_cache_metrics["stale"]) / served, 4) if served else 0.0,
+        "soft_ttl_seconds": RESPONSE_CACHE_SOFT_TTL_SECONDS,
+        "hard_ttl_seconds": RESPONSE_CACHE_HARD_TTL_SECONDS,
+        "breaker": {
+            "state": mongo_breaker["state"],
+            "consecutive_failures": mongo_breaker["failures"],
+            **breaker_metrics
+        }
+    }
+
+#Admission control metrics
+@app.get("/metrics/admission")
+async def get_admission_metrics():
+    return {
+        "limits": ADMISSION_CLASSES,
+        "queue_timeout_seconds": ADMISSION_QUEUE_TIMEOUT_SECONDS,
+        "endpoints": admission_metrics
+    }
+
+#Rebuild the materialized analytics rollups
+@app.post("/admin/movie-stats/rebuild")
+async def rebuild_movie_stats(email: str = Depends(get_current_email)):
+    if email not in ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    # A rebuild means the catalogue changed in a way the fingerprint may not see, so the version moves on
+    await bump_dataset_generation()
+    stats = await refresh_movie_stats(force=True)
+
+    return {"msg": "Movie stats rebuilt", "version": stats["version"], "built_at": stats["built_at"]}
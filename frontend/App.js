@@ -9,8 +9,12 @@ import SearchPage from "./Pages/SearchPage";
 import FilterPage from "./Pages/FilterPage";
 import MovieComparePage from "./Pages/MovieComparePage";
 
-// Create a QueryClient instance
-const queryClient = new QueryClient();
+// Create a QueryClient instance, data seeded from /dashboard stays fresh for a minute
+const queryClient = new QueryClient({
+    defaultOptions: {
+        queries: { staleTime: 1000 * 60 },
+    },
+});
 
 function App() {
     return (
@@ -11,8 +11,11 @@ Chart.register(...registerables);
 // Function to fetch actor frequency data
 const fetchActorFrequency = async () => {
     const { data } = await axios.get('http://127.0.0.1:8000/movies/actors/frequency');
+    return toActorFrequencyChart(data);
+};
 
-    // Transform the data for the chart
+// Transform the data for the chart
+export const toActorFrequencyChart = (data) => {
     if (data && Array.isArray(data)) {
         const transformedData = data.map(item => ({
             actor: item._id.actor,
@@ -3,12 +3,17 @@ import { Card, CardContent, Typography, CircularProgress, Grid } from '@mui/mate
 import axios from 'axios';
 import { Cell, Pie, PieChart, ResponsiveContainer, Tooltip } from "recharts";
 
-const FavoriteMovie = () => {
-    const [movie, setMovie] = useState(null);
-    const [loading, setLoading] = useState(true);
+const FavoriteMovie = ({ initialMovie }) => {
+    const [movie, setMovie] = useState(initialMovie || null);
+    const [loading, setLoading] = useState(!initialMovie);
     const [token, setToken] = useState(localStorage.getItem('token') || null);
 
     useEffect(() => {
+        // The dashboard already loaded the movie with the user profile
+        if (initialMovie) {
+            return;
+        }
+
         const fetchFavoriteMovieId = async () => {
             try {
                 const response = await axios.get(`http://127.0.0.1:8000/movie/favmovie`, {
@@ -35,7 +40,7 @@ const FavoriteMovie = () => {
         };
 
         fetchFavoriteMovieId();
-    }, [token]);
+    }, [token, initialMovie]);
 
     if (loading) {
         return <CircularProgress />;
@@ -3,50 +3,25 @@ import {Grid, Card, CardContent, Typography, CircularProgress, Tooltip } from '@
 import { useQuery } from 'react-query';
 import axios from 'axios';
 
-// Fetch functions
-const fetchTotalMovies = async () => {
-    const { data } = await axios.get('http://127.0.0.1:8000/movies?limit=0');
-    return data.length;
-};
-
-const fetchTopRatedMovie = async () => {
-    const { data } = await axios.get('http://127.0.0.1:8000/movies/top-rated');
-    return data[0] || {};
-};
-
-const fetchMostFrequentGenre = async () => {
-    const { data } = await axios.get('http://127.0.0.1:8000/movies/genre-breakdown');
-    return data[0]?._id || 'N/A';
-};
-
-const fetchMostPopularMovie = async () => {
-    const { data } = await axios.get('http://127.0.0.1:8000/movies/most-popular');
-    return data[0] || {};
-};
-
-const fetchAverageRuntime = async () => {
-    const { data } = await axios.get('http://127.0.0.1:8000/movies');
-    const runtimes = data.map(movie => movie.runtime).filter(rt => rt !== null);
-    const avgRuntime = runtimes.reduce((a, b) => a + b, 0) / runtimes.length;
-    return avgRuntime.toFixed(2);
-};
-
-const fetchUniqueLanguages = async () => {
-    const { data } = await axios.get('http://127.0.0.1:8000/movies/unique-languages');
+// Fetch all KPI values in a single request
+const fetchKpis = async () => {
+    const { data } = await axios.get('http://127.0.0.1:8000/movies/kpis');
     return data;
 };
 
 const KpiCards = () => {
-    const { data: totalMovies, isLoading: loadingTotalMovies } = useQuery('totalMovies', fetchTotalMovies);
-    const { data: topRatedMovie, isLoading: loadingTopRatedMovie } = useQuery('topRatedMovie', fetchTopRatedMovie);
-    const { data: mostFrequentGenre, isLoading: loadingMostFrequentGenre } = useQuery('mostFrequentGenre', fetchMostFrequentGenre);
-    const { data: averageRuntime, isLoading: loadingAverageRuntime } = useQuery('averageRuntime', fetchAverageRuntime);
-    const { data: mostPopularMovie, isLoading: loadingMostPopularMovie } = useQuery('mostPopularMovie', fetchMostPopularMovie);
-    const { data: uniqueLanguages, isLoading: loadingUniqueLanguages } = useQuery('uniqueLanguages', fetchUniqueLanguages);
+    const { data: kpis, isLoading: loadingKpis } = useQuery('movieKpis', fetchKpis);
+
+    const totalMovies = kpis?.totalMovies;
+    const topRatedMovie = kpis?.topRatedMovie || {};
+    const mostFrequentGenre = kpis?.mostFrequentGenre || 'N/A';
+    const averageRuntime = kpis?.averageRuntime?.toFixed(2);
+    const mostPopularMovie = kpis?.mostPopularMovie || {};
+    const uniqueLanguages = kpis?.uniqueLanguages;
 
     const [hoveredCard, setHoveredCard] = useState(null); // State to track hovered card
 
-    if (loadingTotalMovies || loadingTopRatedMovie || loadingMostFrequentGenre || loadingAverageRuntime) {
+    if (loadingKpis) {
         return (
             <Card sx={{ margin: 2, textAlign: 'center' }}>
                 <CardContent>
@@ -93,6 +93,7 @@ const Navbar = () => {
                 if (response.data.access_token) {
                     // Store the token in localStorage (or sessionStorage if you prefer)
                     localStorage.setItem('token', response.data.access_token);
+                    localStorage.setItem('refreshToken', response.data.refresh_token); // Renews the token without the password
                     localStorage.setItem('userEmail', email); // Save the email
                     localStorage.removeItem('fetchState'); //refresh the fetchState
 
@@ -1,6 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
 import {
+    Autocomplete,
     TextField,
     MenuItem,
     Button,
@@ -18,6 +19,8 @@ import axios from 'axios';
 const categories = [
     { label: 'Title', value: 'title' },
     { label: 'Director', value: 'director' },
+    { label: 'Cast', value: 'cast' },
+    { label: 'Keywords', value: 'keywords' },
     // Add more categories as needed
 ];
 
@@ -52,6 +55,23 @@ const SearchBar = () => {
     const navigate = useNavigate();
     const token = localStorage.getItem('token');  // Get token from localStorage
     const [searchHistory, setSearchHistory] = useState([]);  // Store user's search history
+    const [suggestions, setSuggestions] = useState([]);  // Typeahead suggestions for the search term
+
+    // Fetch typeahead suggestions for the selected category while the user types
+    useEffect(() => {
+        if (!searchTerm.trim() || !['title', 'director'].includes(category)) {
+            setSuggestions([]);
+            return;
+        }
+
+        const timer = setTimeout(() => {
+            axios.get('http://127.0.0.1:8000/movies/suggest', { params: { q: searchTerm, type: category } })
+                .then(response => setSuggestions(response.data.map(suggestion => suggestion.label)))
+                .catch(error => console.error('Error fetching suggestions:', error));
+        }, 150);
+
+        return () => clearTimeout(timer);
+    }, [searchTerm, category]);
 
     // Fetch user's search history if token exists
     useEffect(() => {
@@ -147,11 +167,13 @@ const SearchBar = () => {
                         </TextField>
                     </Grid>
                     <Grid item xs={12} md={8}>
-                        <TextField
-                            label="Search"
-                            value={searchTerm}
-                            onChange={(e) => setSearchTerm(e.target.value)}
-                            fullWidth
+                        <Autocomplete
+                            freeSolo
+                            options={suggestions}
+                            filterOptions={(options) => options}
+                            inputValue={searchTerm}
+                            onInputChange={(e, value) => setSearchTerm(value)}
+                            renderInput={(params) => <TextField {...params} label="Search" fullWidth />}
                         />
                     </Grid>
                     <Grid item xs={12}>
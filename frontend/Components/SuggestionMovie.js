@@ -8,10 +8,10 @@ import '../App.css';
 
 const MAX_RECOMMENDATIONS = 5;
 
-const MovieRecommendations = () => {
-    const [searchedMovies, setSearchedMovies] = useState([]);
+const MovieRecommendations = ({ initialMovies }) => {
+    const [searchedMovies, setSearchedMovies] = useState((initialMovies || []).slice(0, MAX_RECOMMENDATIONS));
     const [currentIndex, setCurrentIndex] = useState(0);
-    const [loading, setLoading] = useState(true);
+    const [loading, setLoading] = useState(!initialMovies);
     const [isFading, setIsFading] = useState(false);
     const [fadeDirection, setFadeDirection] = useState('next'); // To track direction for animation
     const [token] = useState(localStorage.getItem('token') || null);
@@ -22,23 +22,21 @@ const MovieRecommendations = () => {
     };
 
     useEffect(() => {
+        // The dashboard already loaded the movies with the user profile
+        if (initialMovies) {
+            return;
+        }
+
         const fetchSearchedMovies = async () => {
             try {
-                const response = await axios.get('http://127.0.0.1:8000/movie/searched', {
+                // Ask the backend to embed the movie details so everything arrives in one request
+                const response = await axios.get('http://127.0.0.1:8000/movie/searched?embed=true', {
                     headers: { Authorization: `Bearer ${token}` },
                 });
 
-                const movieIds = response.data.searchedMovie || [];
-                if (movieIds.length > 0) {
-                    const movieDetails = await Promise.all(
-                        movieIds.slice(0, MAX_RECOMMENDATIONS).map(async (id) => {
-                            const movieResponse = await axios.get(`http://127.0.0.1:8000/movies/${id}`, {
-                                headers: { Authorization: `Bearer ${token}` },
-                            });
-                            return movieResponse.data;
-                        })
-                    );
-                    setSearchedMovies(movieDetails);
+                const movieDetails = response.data.movies || [];
+                if (movieDetails.length > 0) {
+                    setSearchedMovies(movieDetails.slice(0, MAX_RECOMMENDATIONS));
                 }
             } catch (error) {
                 console.error('Error fetching searched movies:', error);
@@ -48,7 +46,7 @@ const MovieRecommendations = () => {
         };
 
         fetchSearchedMovies();
-    }, [token]);
+    }, [token, initialMovies]);
 
     useEffect(() => {
         const interval = setInterval(() => {
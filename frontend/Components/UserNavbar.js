@@ -82,8 +82,16 @@ const UserNavbar = ({ onUpdatePreferences }) => {
     };
 
     const handleLogout = () => {
+        // Revoke the refresh token on the server
+        const refreshToken = localStorage.getItem('refreshToken');
+        if (refreshToken) {
+            axios.post('http://127.0.0.1:8000/movie/logout', { refresh_token: refreshToken })
+                .catch(error => console.error('Error revoking refresh token:', error));
+        }
+
         // Clear token from localStorage
         localStorage.removeItem('token');
+        localStorage.removeItem('refreshToken');
         localStorage.removeItem('selectedGenre');
         localStorage.removeItem('selectedYear');
         localStorage.removeItem('fetchState');
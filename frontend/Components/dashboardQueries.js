@@ -0,0 +1,40 @@
+import axios from 'axios';
+import { toActorFrequencyChart } from './ActorFrequency';
+
+const CHART_FILTER = 'highest-rated';
+
+// Writes each /dashboard widget into the react-query cache entry its component reads
+const seedWidget = {
+    kpis: (queryClient, data) => queryClient.setQueryData('movieKpis', data),
+    genre_breakdown: (queryClient, data) => queryClient.setQueryData('genreData', data),
+    actor_frequency: (queryClient, data) => queryClient.setQueryData('actorFrequency', toActorFrequencyChart(data)),
+    releases_over_time: (queryClient, data) => queryClient.setQueryData('revenueAndCountOverTime', data),
+    ratings_distribution: (queryClient, data) => queryClient.setQueryData('ratingsDistribution', data),
+    top_rated: (queryClient, data) => queryClient.setQueryData(['topMovies', CHART_FILTER], data),
+    production_country: (queryClient, data) => queryClient.setQueryData('productionCountry', data),
+    multi_chart: (queryClient, data) => {
+        queryClient.setQueryData(['topMovies', CHART_FILTER], data.top_rated);
+        queryClient.setQueryData(['popRate', CHART_FILTER], data.pop_vs_rating);
+        queryClient.setQueryData(['production', CHART_FILTER], data.production);
+        queryClient.setQueryData(['actor', CHART_FILTER], data.top_actors);
+    },
+};
+
+// Load every dashboard widget with one request, before the widgets mount
+export const prefetchDashboard = async (queryClient, { widgets, token } = {}) => {
+    try {
+        const { data } = await axios.get('http://127.0.0.1:8000/dashboard', {
+            params: widgets ? { widgets: widgets.join(',') } : {},
+            headers: token ? { Authorization: `Bearer ${token}` } : {},
+        });
+
+        Object.entries(data.widgets).forEach(([name, widget]) => {
+            // Failed widgets are left to fetch their own data
+            if (widget.status === 'ok' && seedWidget[name]) {
+                seedWidget[name](queryClient, widget.data);
+            }
+        });
+    } catch (error) {
+        console.error('Failed to prefetch the dashboard:', error);
+    }
+};
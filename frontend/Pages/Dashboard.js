@@ -1,6 +1,7 @@
 // src/pages/Dashboard.js
 
-import React, {useState} from 'react';
+import React, {useState, useEffect} from 'react';
+import { useQueryClient } from 'react-query';
 import Navbar from '../Components/Navbar';
 import KpiCards from '../Components/KpiCards';
 import TopMoviesChart from '../Components/TopMoviesChart';
@@ -13,14 +14,23 @@ import ActorFrequency from "../Components/ActorFrequency"
 import RatingsDistributionChart from "../Components/RatingsDistributionChart";
 import ProductionCountryChart from "../Components/ProductionCountryChart";
 import { Container, Grid, Card, CardContent, Typography } from '@mui/material';
+import { prefetchDashboard } from '../Components/dashboardQueries';
 
 const Dashboard = () => {
+    const queryClient = useQueryClient();
+    const [ready, setReady] = useState(false);
+
+    useEffect(() => {
+        // Load both widgets with one request before they mount
+        prefetchDashboard(queryClient, { widgets: ['kpis', 'multi_chart'] }).then(() => setReady(true));
+    }, [queryClient]);
+
     return (
         <div>
             <Navbar />
             <Container>
-                <KpiCards />
-                <MultiChart/>
+                {ready && <KpiCards />}
+                {ready && <MultiChart/>}
                 {/*
                 <Grid container spacing={2} sx={{ padding: 2 }}>
                     <ExpandableChartCard title="Top 10 Movies" chart={<TopMoviesChart />} bgColor="#FFC107" />
@@ -12,9 +12,11 @@ import ArrowBackIcon from '@mui/icons-material/ArrowBack';
 // Register required Chart.js components
 ChartJS.register(CategoryScale, LinearScale, BarElement, Title, Tooltip, Legend);
 
-const fetchMovieDetails = async (movieId) => {
-    const { data } = await axios.get(`http://127.0.0.1:8000/movies/${movieId}`);
-    return data;
+// Fetch all selected movies in a single batch request, returned in the order they were requested
+const fetchMovieDetails = async (movieIds) => {
+    const { data } = await axios.get(`http://127.0.0.1:8000/movies/batch?ids=${movieIds.join(',')}`);
+    const moviesById = new Map(data.movies.map(movie => [String(movie.id), movie]));
+    return movieIds.map(movieId => moviesById.get(String(movieId)));
 };
 
 const ComparisonPage = () => {
@@ -22,13 +24,30 @@ const ComparisonPage = () => {
     const location = useLocation();
     const { selectedMovies } = location.state || { selectedMovies: [] };
 
-    const { data: movie1, isLoading: loadingMovie1 } = useQuery(['movie', selectedMovies[0]], () => fetchMovieDetails(selectedMovies[0]));
-    const { data: movie2, isLoading: loadingMovie2 } = useQuery(['movie', selectedMovies[1]], () => fetchMovieDetails(selectedMovies[1]));
+    const { data: movies, isLoading: loadingMovies, isError } = useQuery(['movies', selectedMovies], () => fetchMovieDetails(selectedMovies));
 
-    if (loadingMovie1 || loadingMovie2) {
+    if (loadingMovies) {
         return <CircularProgress />;
     }
 
+    const [movie1, movie2] = movies || [];
+
+    // A failed request or a movie that no longer exists leaves nothing to compare
+    if (isError || !movie1 || !movie2) {
+        return (
+            <Card sx={{ margin: 2, padding: 2 }}>
+                <CardContent>
+                    <Button onClick={() => navigate(-1)} startIcon={<ArrowBackIcon />}>
+                        Back
+                    </Button>
+                    <Typography variant="body1">
+                        {isError ? 'Could not load the selected movies.' : 'One of the selected movies could not be found.'}
+                    </Typography>
+                </CardContent>
+            </Card>
+        );
+    }
+
     // Prepare data for the Bar chart
     const chartData = {
         labels: ['Rating', 'Popularity'],
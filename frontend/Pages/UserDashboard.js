@@ -3,6 +3,8 @@
 import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { jwtDecode } from 'jwt-decode'; // Correctly importing jwtDecode as a named import
+import { useQueryClient } from 'react-query';
+import { prefetchDashboard } from '../Components/dashboardQueries';
 import UserNavbar from '../Components/UserNavbar';
 import KpiCards from '../Components/KpiCards';
 import TopMoviesChart from '../Components/TopMoviesChart';
@@ -20,6 +22,7 @@ import {Card, CardContent, Container, Grid, Typography} from '@mui/material';
 
 const UserDashboard = () => {
     const navigate = useNavigate();
+    const queryClient = useQueryClient();
 
     useEffect(() => {
         const token = localStorage.getItem('token'); // Retrieve the token
@@ -36,36 +39,69 @@ const UserDashboard = () => {
             return decodedToken.exp < currentTime; // Check if the token is expired
         };
 
+        // Renew an expired token with the refresh token, or send the user back to login
+        const refreshToken = async () => {
+            try {
+                const response = await fetch('http://127.0.0.1:8000/movie/refresh', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ refresh_token: localStorage.getItem('refreshToken') }),
+                });
+                if (!response.ok) {
+                    throw new Error(`Refresh failed with status ${response.status}`);
+                }
+                const data = await response.json();
+                localStorage.setItem('token', data.access_token);
+                localStorage.setItem('refreshToken', data.refresh_token);
+                navigate(0); // Reload so every widget picks up the new token
+            } catch (error) {
+                localStorage.removeItem('token'); // Remove expired token
+                localStorage.removeItem('refreshToken');
+                navigate('/'); // Redirect to login page
+            }
+        };
+
         // Check if the token is expired
         if (isTokenExpired(token)) {
-            localStorage.removeItem('token'); // Remove expired token
-            navigate('/'); // Redirect to login page
+            if (localStorage.getItem('refreshToken')) {
+                refreshToken();
+            } else {
+                localStorage.removeItem('token'); // Remove expired token
+                navigate('/'); // Redirect to login page
+            }
         }
     }, [navigate]);
 
     const [preferences, setPreferences] = useState([]);
+    const [profile, setProfile] = useState(null);
 
     const handleUpdatePreferences = (newPreferences) => {
         setPreferences(newPreferences);
     };
 
     useEffect(() => {
-        const fetchPreferences = async () => {
+        const fetchProfile = async () => {
             try {
-                const response = await fetch('http://127.0.0.1:8000/movie/user-preferences', {
-                    headers: {
-                        Authorization: `Bearer ${localStorage.getItem('token')}`,
-                    },
-                });
+                // One request for the preferences and the movies the widgets show, and one for the charts
+                const token = localStorage.getItem('token');
+                const [response] = await Promise.all([
+                    fetch('http://127.0.0.1:8000/movie/me?embed=true', {
+                        headers: {
+                            Authorization: `Bearer ${token}`,
+                        },
+                    }),
+                    prefetchDashboard(queryClient, { token }),
+                ]);
                 const data = await response.json();
-                setPreferences(data.components);
+                setProfile(data);
+                setPreferences(data.preferences || []);
             } catch (error) {
                 console.error('Failed to fetch preferences:', error);
             }
         };
 
-        fetchPreferences();
-    }, []);
+        fetchProfile();
+    }, [queryClient]);
 
     return (
         <div>
@@ -77,7 +113,7 @@ const UserDashboard = () => {
                         .map(pref => {
                          switch (pref.id) {
                             case "1":
-                                return <FavoriteMovie key={pref.id} />;
+                                return <FavoriteMovie key={pref.id} initialMovie={profile?.favouriteMovieDetails} />;
                             case "2":
                                 return <KpiCards key={pref.id} />;
                             case "3":
@@ -111,7 +147,7 @@ const UserDashboard = () => {
                                      <ExpandableChartCard title="Movies by Production Country" chart={<ProductionCountryChart />} bgColor="#FFC0CB" key={pref.id}/>
                                  );
                             case "11":
-                                 return <SuggestedMovies key={pref.id}/>
+                                 return <SuggestedMovies key={pref.id} initialMovies={profile?.searchedMovies}/>
                             case "12":
                                  return <MultiChart key={pref.id}/>
                             default: